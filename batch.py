@@ -0,0 +1,131 @@
+"""Conversion of many files at once, each file being converted row by row (as
+with `-convert`) by one of a pool of processes.
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from parser import Parser
+from writer import EXTENSIONS, ILLEGAL_CHARACTERS, Writer
+
+FORMATS = (".pbm", ".pgm", ".ppm")
+
+
+def find_files(patterns: list):
+    """Find the files to convert
+
+    :param patterns: directories (whose files are all taken, without their
+        sub-directories), globs (`**` going through sub-directories) or files
+    :type patterns: list[str]
+    :return: the files with the extension of a bitmap file, each one once, in
+        the order of the patterns
+    :rtype: list[str]
+    """
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        filenames.extend(
+            filename
+            for filename in sorted(matches)
+            if filename.endswith(FORMATS) and os.path.isfile(filename)
+        )
+    return list(dict.fromkeys(filenames))
+
+
+def output_names(filenames: list, version: str, directory: str):
+    """Choose the names of the converted files, all at once: each name is the
+    name of its file, with the characters refused by `Writer` replaced by
+    "_" and followed by "-1", "-2"... when it is already taken (by a file of
+    the directory or by another converted file).
+
+    :param filenames: the files to convert
+    :type filenames: list[str]
+    :param version: the version to convert to
+    :type version: str
+    :param directory: the folder of the converted files
+    :type directory: str
+    :return: the names of the converted files, without their extension
+    :rtype: list[str]
+    """
+    extension = EXTENSIONS[version]
+    taken = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+    names = []
+    for filename in filenames:
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        stem = "".join("_" if car in ILLEGAL_CHARACTERS else car for car in stem)
+        name, number = stem, 0
+        while f"{name}.{extension}" in taken:
+            number += 1
+            name = f"{stem}-{number}"
+        taken.add(f"{name}.{extension}")
+        names.append(name)
+    return names
+
+
+def convert_file(filename: str, version: str, name: str, directory: str):
+    """Convert a file, without decoding the whole picture. No error is
+    raised: the error which stopped the conversion is returned instead.
+
+    :param filename: Path of the file to convert
+    :type filename: str
+    :param version: the version to convert to
+    :type version: str
+    :param name: name of the converted file, without its extension
+    :type name: str
+    :param directory: the folder of the converted file
+    :type directory: str
+    :return: the file, the converted file (None if the conversion failed),
+        the size of the file in bytes and the error which stopped the
+        conversion (None if it succeeded)
+    :rtype: tuple[str, str | None, int, str | None]
+    """
+    writer = None
+    try:
+        size = os.path.getsize(filename)
+        writer = Writer(Parser(filename, stream=True), version, name, directory)
+        writer.write()
+    except Exception as error:
+        # the other files are converted whatever happened to this one, and
+        # nothing is left of its partly written file
+        if writer is not None and os.path.isfile(writer.file_name):
+            os.remove(writer.file_name)
+        if not isinstance(error, (OSError, ValueError)):
+            return filename, None, 0, f"{type(error).__name__}: {error}"
+        return filename, None, 0, str(error)
+    return filename, writer.file_name, size, None
+
+
+def convert_files(filenames: list, version: str, directory: str = ".", workers=1):
+    """Convert files to the same version, in parallel. A file which cannot be
+    converted is skipped, its error being given with its result.
+
+    :param filenames: the files to convert
+    :type filenames: list[str]
+    :param version: the version to convert to
+    :type version: str
+    :param directory: the folder of the converted files (created if needed),
+        defaults to the current folder
+    :type directory: str, optional
+    :param workers: number of processes converting the files, defaults to 1
+    :type workers: int, optional
+    :yield: the result of `convert_file` for each file, as soon as it is
+        converted
+    :rtype: Iterator[tuple[str, str | None, int, str | None]]
+    """
+    os.makedirs(directory, exist_ok=True)
+    jobs = zip(filenames, output_names(filenames, version, directory))
+    if workers <= 1:
+        for filename, name in jobs:
+            yield convert_file(filename, version, name, directory)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(convert_file, filename, version, name, directory)
+            for filename, name in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
@@ -1,75 +1,576 @@
+import math
+import queue
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from time import time
+
 import fltk
+import render
+from picture import IndexedPicture, Picture
+from pyramid import Pyramid
+
+RENDERERS = {"image", "rectangles", "blocks"}
+LOOPS = {"events", "polling"}
+# size of the tiles of the image renderer, in pixels of the window
+TILE = 256
+# number of tiles kept once rendered
+TILE_CACHE = 64
+# maximum size of the window
+VIEWPORT = (1024, 768)
+MIN_ZOOM, MAX_ZOOM = 1 / 64, 64
+PAN_KEYS = {"Left": (-1, 0), "Right": (1, 0), "Up": (0, -1), "Down": (0, 1)}
+ZOOM_IN_KEYS = {"plus", "KP_Add"}
+ZOOM_OUT_KEYS = {"minus", "KP_Subtract"}
+# number of rows sent at once by the thread decoding a file
+BAND = 32
+# maximum number of bands waiting to be displayed
+PENDING_BANDS = 64
+# minimum time between two draws while a file is being decoded, in seconds
+REDRAW_INTERVAL = 0.1
 
 
 class Bitmap:
     """Object representing an PPM file picture"""
 
-    def __init__(self, infos: dict, pixel_size: int, rotate: int):
+    def __init__(
+        self,
+        infos: dict,
+        pixel_size: int,
+        rotate: int,
+        renderer: str = "image",
+        viewport: tuple = VIEWPORT,
+        pyramid: Pyramid = None,
+        loop: str = "events",
+        refresh_rate: int = 100,
+    ):
         """Initialisation
 
-        :param infos: dictionnary representing the images propreties
+        :param infos: dictionnary representing the images propreties. If the
+            picture is not decoded yet (a Parser created with `stream`), it
+            is decoded by a thread and displayed band by band
         :type infos: dict
-        :param pixel_size: zoom degree (1 pixel = 1 pixel size)
-        :type pixel_size: int
+        :param pixel_size: zoom degree (1 pixel = 1 pixel size), possibly
+            fractional, 0 to zoom out until the picture fits in the viewport
+        :type pixel_size: float
         :param rotate: The rotation angle (only 0, 90, 180, 270)
         :type rotate: int
+        :param renderer: "image" to display the picture as a single image,
+            "rectangles" to draw one rectangle per run of pixels of the same
+            color in a row, "blocks" to also merge identical runs of
+            consecutive rows, defaults to "image"
+        :type renderer: str, optional
+        :param viewport: maximum width and height of the window, used by the
+            image renderer, defaults to VIEWPORT
+        :type viewport: tuple[int, int], optional
+        :param pyramid: reduced versions of the picture, used when zoomed
+            out, defaults to a pyramid built from the picture
+        :type pyramid: Pyramid, optional
+        :param loop: "events" to only work when an event arrives (with the
+            loop of tkinter), "polling" to look for events `refresh_rate`
+            times per second, defaults to "events"
+        :type loop: str, optional
+        :param refresh_rate: number of updates of the window per second:
+            the polling frequency, or how often rows decoded in the
+            background are received, defaults to 100
+        :type refresh_rate: int, optional
         """
         self.infos = infos
         self.picture = infos["picture"]
         self.pixel_size = pixel_size
         self.width, self.height = infos["size"]
+        self.rows = None
+        if self.picture is None:
+            channels = 3 if infos["file version"] in {"P3", "P6"} else 1
+            self.picture = Picture(self.width, self.height, channels)
+            self.start_loading(infos)
         self.rotate = rotate
-        if rotate not in {0, 90, 180, 270}:
+        self.renderer = renderer
+        self.loop = loop
+        self.refresh_rate = refresh_rate
+        self.rotations = {}
+        self.pyramid = pyramid if pyramid is not None else Pyramid(self.picture)
+        self.viewport = viewport
+        self.offset = (0, 0)
+        self.tiles = OrderedDict()
+        # numbers of rectangles and of pixels of the last drawing of the
+        # rectangle renderers, None with the image renderer
+        self.drawn_rectangles = None
+        if rotate not in {0, 90, 180, 270} or renderer not in RENDERERS:
+            raise ValueError
+        if loop not in LOOPS or refresh_rate <= 0:
             raise ValueError
+        if not 0 <= pixel_size < math.inf:
+            raise ValueError
+        self.zoom = int(pixel_size) if pixel_size == int(pixel_size) else pixel_size
+        if pixel_size == 0:
+            self.pixel_size = self.zoom = 1
+            if renderer == "image":
+                self.zoom = self.fit_zoom()
 
     def build(self):
-        """Build the window to represent the ppm image"""
-        width, height = self.width, self.height
+        """Build the window to represent the ppm image.
+        With the image renderer, only the visible part of the picture is
+        drawn: arrow keys or a left click move the view, '+' and '-' zoom.
+        The window stays responsive while the file is being decoded.
+        """
+        fltk.cree_fenetre(*self.window_size(), self.refresh_rate)
+        self.draw()
+
+        if self.loop == "events":
+            receive = self.receive_rows if self.rows is not None else None
+            fltk.boucle_evenements(self.on_event, receive, 1 / self.refresh_rate)
+        else:
+            tev = None
+            while tev != "Quitte":
+                if self.rows is not None:
+                    self.receive_rows()
+                ev = fltk.donne_ev()
+                tev = fltk.type_ev(ev)
+                self.on_event(ev)
+                fltk.mise_a_jour()
+        if self.rows is not None:
+            self.stop.set()
+        fltk.ferme_fenetre()
+
+    def start_loading(self, parser):
+        """Start the thread decoding the rows of the picture
+
+        :param parser: the parser of the file, created with `stream`
+        :type parser: Parser
+        """
+        self.rows = queue.Queue(PENDING_BANDS)
+        self.stop = threading.Event()
+        self.loaded = 0
+        # number of rows already shown by the levels and rotated pictures
+        self.shown = 0
+        self.drawn = time()
+        thread = threading.Thread(target=self.load, args=(parser,), daemon=True)
+        thread.start()
+
+    def load(self, parser):
+        """Decode the rows of the picture and send them to `self.rows` by
+        bands of BAND rows, followed by None (run by the decoding thread)
+
+        :param parser: the parser of the file, created with `stream`
+        :type parser: Parser
+        """
+        band = []
+        try:
+            for row in parser.iter_rows():
+                if self.stop.is_set():
+                    return
+                band.append(bytes(row))
+                if len(band) == BAND:
+                    if not self.send(band):
+                        return
+                    band = []
+        except Exception as error:
+            # any error is raised again by `receive_rows`, otherwise the window
+            # would wait for the rest of the picture forever
+            self.send(error)
+            return
+        if not band or self.send(band):
+            self.send(None)
+
+    def send(self, item):
+        """Put an item in `self.rows`, waiting for room in the queue until the
+        window is closed (run by the decoding thread)
+
+        :param item: a band of rows, an error or None
+        :type item: list[bytes] | Exception | None
+        :return: False if the window was closed before the item was sent
+        :rtype: bool
+        """
+        while not self.stop.is_set():
+            try:
+                self.rows.put(item, timeout=REDRAW_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def receive_rows(self):
+        """Copy the rows decoded so far in the picture, and draw it again at
+        most every REDRAW_INTERVAL seconds
+
+        :raises Exception: the error which stopped the decoding of the file
+        :return: True while the file is being decoded
+        :rtype: bool
+        """
+        while self.rows is not None:
+            try:
+                band = self.rows.get_nowait()
+            except queue.Empty:
+                break
+            if band is None:
+                self.rows = None
+            elif isinstance(band, Exception):
+                self.rows = None
+                raise band
+            else:
+                start = self.loaded * self.picture.row_size
+                samples = b"".join(band)
+                self.picture.data[start : start + len(samples)] = samples
+                self.loaded += len(band)
+        if self.loaded > self.shown and (
+            self.rows is None or time() - self.drawn >= REDRAW_INTERVAL
+        ):
+            self.show_rows(self.shown, self.loaded)
+            self.shown = self.loaded
+            self.draw()
+            self.drawn = time()
+        return self.rows is not None
+
+    def show_rows(self, first: int, last: int):
+        """Update the levels of the pyramid and the rotated pictures built so
+        far with new rows of the picture, without building them again
+
+        :param first: the first new row
+        :type first: int
+        :param last: the row after the last new row
+        :type last: int
+        """
+        self.pyramid.update(first, last)
+        for (angle, level), rotated in self.rotations.items():
+            if angle == 0:
+                # the level itself
+                continue
+            picture = self.pyramid.level(level)
+            top, bottom = first >> level, -(-last >> level)
+            band = picture.crop(0, top, picture.width, bottom - top).rotate(angle)
+            if angle == 90:
+                rotated.paste(band, top, 0)
+            elif angle == 180:
+                rotated.paste(band, 0, picture.height - bottom)
+            else:
+                rotated.paste(band, picture.height - bottom, 0)
+        self.tiles.clear()
+
+    def on_event(self, ev):
+        """Handle an event of the window
+
+        :param ev: the event, as given by fltk
+        :type ev: tuple | None
+        """
+        tev = fltk.type_ev(ev)
+        if tev == "Touche":
+            self.on_key(fltk.touche(ev))
+        elif tev == "ClicGauche" and self.renderer == "image":
+            width, height = self.window_size()
+            x, y = self.offset
+            self.move(
+                x + fltk.abscisse(ev) - width // 2,
+                y + fltk.ordonnee(ev) - height // 2,
+            )
+            self.draw()
+
+    def on_key(self, touche: str):
+        """Rotate, zoom or move the view depending on the pressed key
+
+        :param touche: the key symbol
+        :type touche: str
+        """
+        if touche == "r" or touche == "R":
+            self.rotate = (self.rotate + 90) % 360
+            fltk.redimensionne_fenetre(*self.window_size())
+            self.move(*self.offset)
+        elif self.renderer != "image":
+            return
+        elif touche in ZOOM_IN_KEYS:
+            self.set_zoom(min(self.zoom * 2, MAX_ZOOM))
+        elif touche in ZOOM_OUT_KEYS:
+            self.set_zoom(max(self.zoom / 2, self.min_zoom()))
+        elif touche in PAN_KEYS:
+            width, height = self.window_size()
+            x, y = self.offset
+            dx, dy = PAN_KEYS[touche]
+            self.move(x + dx * width // 4, y + dy * height // 4)
+        else:
+            return
+        self.draw()
+
+    def min_zoom(self):
+        """Give the smallest zoom, at which the picture is shown as the
+        smallest level of the pyramid
+
+        :return: the zoom (1 / a power of 2)
+        :rtype: float
+        """
+        return max(MIN_ZOOM, 1 / 2 ** (len(self.pyramid) - 1))
+
+    def fit_zoom(self):
+        """Give the biggest zoom, up to 1, at which the whole picture fits in
+        the viewport
+
+        :return: the zoom (1 or 1 / a power of 2)
+        :rtype: float
+        """
+        width, height = self.infos["size"]
         if self.rotate in {90, 270}:
-            width, height = self.height, self.width
-        fltk.cree_fenetre(width * self.pixel_size, height * self.pixel_size)
-
-        for y in range(height):
-            for x in range(width):
-                if self.rotate == 0:
-                    r_x, r_y = x, y
-                elif self.rotate == 180:
-                    r_x, r_y = width - x - 1, height - y - 1
-                elif self.rotate == 90:
-                    r_x, r_y = y, x
-                elif self.rotate == 270:
-                    r_x, r_y = height - y - 1, width - x - 1
-
-                cell = self.picture[r_y][r_x]
-                color = self.list_to_hex(cell)
+            width, height = height, width
+        zoom = 1
+        while zoom > self.min_zoom() and (
+            width * zoom > self.viewport[0] or height * zoom > self.viewport[1]
+        ):
+            zoom /= 2
+        return zoom
 
+    def level(self):
+        """Give the level of the pyramid shown at the current zoom: the
+        smallest level which is not smaller than the displayed picture
+
+        :return: the level, 0 (the picture itself) when zoom is 1 or more
+        :rtype: int
+        """
+        return render.level(self.pyramid, self.zoom)
+
+    def scale(self):
+        """Give how the level of the current zoom is displayed
+
+        :return: the integer zoom applied by tkinter, or None if the level
+            must be resized, and the size of the resized level
+        :rtype: tuple[int | None, tuple[int, int]]
+        """
+        level = self.level()
+        picture = self.displayed(level)
+        factor = self.zoom * 2**level
+        if factor == int(factor):
+            return int(factor), (picture.width, picture.height)
+        return None, render.scaled_size(picture, factor)
+
+    def display_size(self):
+        """Give the size of the whole picture once rotated and zoomed
+
+        :return: the width and height, in pixels of the window
+        :rtype: tuple[int, int]
+        """
+        zoom, (width, height) = self.scale()
+        if zoom is None:
+            return width, height
+        return width * zoom, height * zoom
+
+    def window_size(self):
+        """Give the size of the window: the whole picture, limited to the
+        viewport for the image renderer
+
+        :return: the width and height of the window
+        :rtype: tuple[int, int]
+        """
+        width, height = self.display_size()
+        if self.renderer != "image":
+            return width, height
+        return min(width, self.viewport[0]), min(height, self.viewport[1])
+
+    def move(self, x: int, y: int):
+        """Move the view, keeping it inside the picture
+
+        :param x: abscissa of the top left corner of the view
+        :type x: int
+        :param y: ordinate of the top left corner of the view
+        :type y: int
+        """
+        width, height = self.display_size()
+        view_width, view_height = self.window_size()
+        self.offset = (
+            max(0, min(x, width - view_width)),
+            max(0, min(y, height - view_height)),
+        )
+
+    def set_zoom(self, zoom: float):
+        """Change the zoom, keeping the center of the view in place
+
+        :param zoom: the new zoom
+        :type zoom: float
+        """
+        width, height = self.window_size()
+        center_x = (self.offset[0] + width / 2) / self.zoom
+        center_y = (self.offset[1] + height / 2) / self.zoom
+        if zoom == int(zoom):
+            zoom = int(zoom)
+        self.zoom = zoom
+        fltk.redimensionne_fenetre(*self.window_size())
+        width, height = self.window_size()
+        self.move(int(center_x * zoom - width / 2), int(center_y * zoom - height / 2))
+
+    def draw(self):
+        """Draw the displayed picture, replacing what was drawn before.
+        The image renderer draws the tiles visible in the window, taken from
+        the level of the pyramid matching the zoom when zoomed out, and
+        enlarged by tkinter or, for fractional zooms, resized one by one.
+        """
+        if self.renderer != "image":
+            picture = self.displayed()
+            fltk.efface_tout()
+            items = self.draw_rectangles(picture, self.renderer == "blocks")
+            self.drawn_rectangles = (items, picture.width * picture.height)
+            return
+        zoom, _ = self.scale()
+        picture = self.displayed(self.level())
+        display_width, display_height = self.display_size()
+        if zoom is None:
+            # each tile is resized from its own block of pixels of the level,
+            # so that only the visible part of the picture is resized
+            size = max(1, round(TILE * picture.width / display_width))
+        else:
+            size = max(1, TILE // zoom)
+        width, height = self.window_size()
+        left, top = self.offset
+        columns = self.tile_edges(picture.width, display_width, size, left, width)
+        rows = self.tile_edges(picture.height, display_height, size, top, height)
+        fltk.efface("tuile")
+        for row, y, next_y in rows:
+            for column, x, next_x in columns:
+                shown = None if zoom is not None else (next_x - x, next_y - y)
+                fltk.image_donnees(
+                    x - left,
+                    y - top,
+                    self.tile(picture, column, row, size, shown),
+                    zoom or 1,
+                    tag="tuile",
+                )
+
+    def tile_edges(
+        self, length: int, displayed: int, size: int, start: int, visible: int
+    ):
+        """Find the tiles visible along one side of the window
+
+        :param length: length of the displayed picture, in its pixels
+        :type length: int
+        :param displayed: length of the displayed picture, in pixels of the
+            window
+        :type displayed: int
+        :param size: size of the tiles, in pixels of the picture
+        :type size: int
+        :param start: position of the view, in pixels of the window
+        :type start: int
+        :param visible: length of the view, in pixels of the window
+        :type visible: int
+        :return: the index of each visible tile, with the positions of its
+            first pixel and of the pixel after its last one in the window
+        :rtype: list[tuple[int, int, int]]
+        """
+        first = start * length // displayed // size
+        last = (start + visible) * length // displayed // size + 1
+        last = min(last, -(-length // size))
+        edges = [
+            min(index * size, length) * displayed // length
+            for index in range(first, last + 1)
+        ]
+        return [
+            (index, edges[index - first], edges[index - first + 1])
+            for index in range(first, last)
+        ]
+
+    def tile(
+        self, picture: Picture, column: int, row: int, size: int, shown=None
+    ):
+        """Give the data of a tile of the displayed picture. The most recently
+        used tiles are kept, up to TILE_CACHE tiles.
+
+        :param picture: the displayed picture
+        :type picture: Picture
+        :param column: column of the tile
+        :type column: int
+        :param row: row of the tile
+        :type row: int
+        :param size: size of the tiles, in pixels of the picture
+        :type size: int
+        :param shown: size of the tile once resized, defaults to None (the
+            tile is not resized)
+        :type shown: tuple[int, int], optional
+        :return: the content of a P6 (or P5) file holding the tile
+        :rtype: bytes
+        """
+        key = (self.rotate, self.zoom, size, column, row)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+        else:
+            part = picture.crop(column * size, row * size, size, size)
+            if shown is not None:
+                part = part.resize(*shown)
+            self.tiles[key] = part.pnm()
+            if len(self.tiles) > TILE_CACHE:
+                self.tiles.popitem(last=False)
+        return self.tiles[key]
+
+    def displayed(self, level: int = 0):
+        """Give the picture as it is displayed. Rotated pictures are kept, so
+        that rotating again to the same angle costs nothing.
+
+        :param level: the level of the pyramid, defaults to 0 (the picture
+            itself)
+        :type level: int, optional
+        :return: the picture (or its reduced version) rotated by `self.rotate`
+        :rtype: Picture
+        """
+        key = (self.rotate, level)
+        if key not in self.rotations:
+            self.rotations[key] = self.pyramid.level(level).rotate(self.rotate)
+        return self.rotations[key]
+
+    def runs(self, picture: Picture, y: int):
+        """Split a row in runs of pixels of the same color
+
+        :param picture: the displayed picture
+        :type picture: Picture
+        :param y: the index of the row
+        :type y: int
+        :return: the color and the length of each run, from left to right
+        :rtype: list[tuple[tuple[int], int]]
+        """
+        if isinstance(picture, IndexedPicture):
+            # runs of the same index are runs of the same color
+            return [
+                (picture.palette[index], sum(1 for _ in run))
+                for index, run in groupby(picture.index_row(y))
+            ]
+        row = picture.row(y)
+        if picture.channels == 1:
+            pixels = zip(row, row, row)
+        else:
+            pixels = zip(row[0::3], row[1::3], row[2::3])
+        return [(color, sum(1 for _ in run)) for color, run in groupby(pixels)]
+
+    def draw_rectangles(self, picture: Picture, blocks: bool = False):
+        """Draw the picture with one rectangle per run of pixels of the same
+        color. With `blocks`, a run is also merged with the identical runs
+        (same color, same columns) of the following rows.
+
+        :param picture: the displayed picture
+        :type picture: Picture
+        :param blocks: merge identical runs of consecutive rows, defaults to
+            False
+        :type blocks: bool, optional
+        :return: the number of rectangles drawn
+        :rtype: int
+        """
+        colors = {}
+        opened = {}
+        items = 0
+        for y in range(picture.height + 1):
+            spans = {}
+            if y < picture.height:
+                x = 0
+                for color, length in self.runs(picture, y):
+                    span = (x, x + length, color)
+                    spans[span] = opened.pop(span, y) if blocks else y
+                    x += length
+            # the runs which are not continued on this row are complete
+            for (start, end, color), top in opened.items():
+                if color not in colors:
+                    colors[color] = self.list_to_hex(color)
                 fltk.rectangle(
-                    x * self.pixel_size,
+                    start * self.pixel_size,
+                    top * self.pixel_size,
+                    end * self.pixel_size,
                     y * self.pixel_size,
-                    (x + 1) * self.pixel_size,
-                    (y + 1) * self.pixel_size,
-                    couleur=color,
-                    remplissage=color,
+                    couleur=colors[color],
+                    remplissage=colors[color],
                 )
-
-        tev = None
-        re_open = False
-        while tev != "Quitte":
-            ev = fltk.donne_ev()
-            tev = fltk.type_ev(ev)
-            if tev == "Touche":
-                touche = fltk.touche(ev)
-                if touche == "r" or touche == "R":
-                    if self.rotate == 270:
-                        self.rotate = 0
-                    else:
-                        self.rotate += 90
-                    re_open = True
-                    tev = "Quitte"
-            fltk.mise_a_jour()
-        fltk.ferme_fenetre()
-        if re_open:
-            self.build()
+                items += 1
+            opened = spans
+        return items
 
     def int_to_hex(self, nb: int):
         """Convernt an integer value to it's hexadecimal value
@@ -93,5 +594,5 @@ class Bitmap:
             nb = "0" + nb
         return nb
 
-    def list_to_hex(self, lst: list[int]):
+    def list_to_hex(self, lst: tuple[int]):
         return "#" + "".join([self.int_to_hex(n) for n in lst])
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import time
+from array import array
+
+from picture import IndexedPicture, Picture, WidePicture
+
+
+class RasterCache:
+    """On-disk cache of decoded pictures.
+
+    Entries are stored in `directory`, one file per distinct file content:
+    a line of JSON with the header of the file, followed by the packed
+    samples (or by the indexes of the pixels in a palette stored in the
+    header, see `IndexedPicture`). Reduced pictures (see `Pyramid`) are
+    stored the same way, next to the entry of their file. An index maps the
+    path, size and modification time of each parsed file to the hash of its
+    content, so that the content is hashed only when the file changes. When the cache
+    grows over `max_size`, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str, max_size: int = 1 << 30):
+        """Initialisation
+
+        :param directory: the directory holding the cache (created if needed)
+        :type directory: str
+        :param max_size: maximum size of the entries, in bytes, defaults to
+            1 GiB
+        :type max_size: int, optional
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.index_name = os.path.join(directory, "index.json")
+        try:
+            with open(self.index_name) as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {"files": {}, "entries": {}}
+        # hashes of the files missing from the cache, computed by `load` and
+        # used again by `store`
+        self.hashes = {}
+
+    def save_index(self):
+        """Write the index of the cache"""
+        with open(self.index_name, "w") as file:
+            json.dump(self.index, file)
+
+    def file_key(self, filename: str):
+        """Give the key identifying a file in its current state
+
+        :param filename: Path of the file
+        :type filename: str
+        :return: the key, made of the path, size and modification time
+        :rtype: str
+        """
+        stat = os.stat(filename)
+        return f"{os.path.abspath(filename)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def content_hash(self, filename: str):
+        """Hash the content of a file
+
+        :param filename: Path of the file
+        :type filename: str
+        :return: the hash
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_name(self, name: str):
+        """Give the path of an entry
+
+        :param name: the name of the entry: the hash of the content of a
+            file, followed by a level for its reduced pictures
+        :type name: str
+        :return: the path of the entry
+        :rtype: str
+        """
+        return os.path.join(self.directory, f"{name}.raster")
+
+    def read_entry(self, name: str):
+        """Read an entry of the cache
+
+        :param name: the name of the entry
+        :type name: str
+        :return: the header of the entry and its picture, None if the entry
+            is missing or damaged
+        :rtype: tuple[dict, Picture] | None
+        """
+        try:
+            with open(self.entry_name(name), "rb") as file:
+                header = json.loads(file.readline())
+                width, height = header["size"]
+                maximum = header.get("maximum", 255)
+                palette = header.get("palette")
+                # pictures with a palette store one index per pixel
+                channels = 1 if palette is not None else header["channels"]
+                count = width * height * channels
+                if maximum > 255:
+                    samples = array("H")
+                    samples.frombytes(file.read(2 * count))
+                else:
+                    samples = bytearray(count)
+                    file.readinto(samples)
+                if len(samples) != count:
+                    return None
+        except (OSError, ValueError):
+            return None
+        if palette is not None:
+            palette = [tuple(color) for color in palette]
+            picture = IndexedPicture(width, height, 3, samples, palette)
+        elif maximum > 255:
+            picture = WidePicture(width, height, header["channels"], samples, maximum)
+        else:
+            picture = Picture(width, height, header["channels"], samples)
+        size = count * 2 if maximum > 255 else count
+        self.index["entries"][name] = [size, time.time()]
+        self.save_index()
+        return header, picture
+
+    def write_entry(self, name: str, header: dict, picture: Picture):
+        """Write an entry of the cache, removing old entries if the cache
+        gets too big
+
+        :param name: the name of the entry
+        :type name: str
+        :param header: the infos stored along with the picture
+        :type header: dict
+        :param picture: the picture
+        :type picture: Picture
+        """
+        header = dict(header, size=(picture.width, picture.height))
+        header["channels"] = picture.channels
+        if picture.maximum > 255:
+            # samples above 255 are kept as they are, two bytes each
+            header["maximum"] = picture.maximum
+            samples = memoryview(picture.data).cast("B")
+        elif isinstance(picture, IndexedPicture):
+            # pictures with few colors are kept as a palette and indexes
+            header["palette"] = picture.palette
+            samples = picture.indexes
+        else:
+            samples = picture.buffer()
+        with open(self.entry_name(name), "wb") as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            file.write(samples)
+        self.index["entries"][name] = [len(samples), time.time()]
+        self.evict()
+
+    def load(self, filename: str):
+        """Load the decoded picture of a file, if it is in the cache
+
+        :param filename: Path of the parsed file
+        :type filename: str
+        :return: the infos of the file (with its picture), None if the file
+            is not in the cache
+        :rtype: dict | None
+        """
+        key = self.file_key(filename)
+        content = self.index["files"].get(key)
+        if content is None:
+            content = self.content_hash(filename)
+            if content not in self.index["entries"]:
+                self.hashes[key] = content
+                return None
+            self.index["files"][key] = content
+        entry = self.read_entry(content)
+        if entry is None:
+            return None
+        header, picture = entry
+        return {
+            "file version": header["file version"],
+            "size": (picture.width, picture.height),
+            "maximum color value": header["maximum color value"],
+            "picture": picture,
+        }
+
+    def store(self, filename: str, infos: dict):
+        """Add the decoded picture of a file to the cache
+
+        :param filename: Path of the parsed file
+        :type filename: str
+        :param infos: the infos of the file, with its picture
+        :type infos: dict
+        """
+        key = self.file_key(filename)
+        content = self.hashes.pop(key, None) or self.content_hash(filename)
+        header = {
+            "file version": infos["file version"],
+            "maximum color value": infos["maximum color value"],
+        }
+        self.index["files"][key] = content
+        self.write_entry(content, header, infos["picture"])
+        self.save_index()
+
+    def load_level(self, filename: str, level: int):
+        """Load a reduced picture of a file (see `Pyramid`), if it is in the
+        cache
+
+        :param filename: Path of the parsed file
+        :type filename: str
+        :param level: the level of the picture (its size is divided by
+            2 ** level)
+        :type level: int
+        :return: the reduced picture, None if it is not in the cache
+        :rtype: Picture | None
+        """
+        content = self.index["files"].get(self.file_key(filename))
+        if content is None:
+            return None
+        entry = self.read_entry(f"{content}.{level}")
+        return None if entry is None else entry[1]
+
+    def store_level(self, filename: str, level: int, picture: Picture):
+        """Add a reduced picture of a file to the cache. Nothing is stored if
+        the file itself is not in the cache.
+
+        :param filename: Path of the parsed file
+        :type filename: str
+        :param level: the level of the picture (its size is divided by
+            2 ** level)
+        :type level: int
+        :param picture: the reduced picture
+        :type picture: Picture
+        """
+        content = self.index["files"].get(self.file_key(filename))
+        if content is None:
+            return
+        self.write_entry(f"{content}.{level}", {"level": level}, picture)
+        self.save_index()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        `self.max_size`"""
+        entries = self.index["entries"]
+        total = sum(size for size, _ in entries.values())
+        for content in sorted(entries, key=lambda content: entries[content][1]):
+            if total <= self.max_size:
+                break
+            total -= entries.pop(content)[0]
+            try:
+                os.remove(self.entry_name(content))
+            except OSError:
+                pass
+        self.index["files"] = {
+            key: content
+            for key, content in self.index["files"].items()
+            if content in entries
+        }
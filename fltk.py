@@ -18,7 +18,9 @@ __all__ = [
     # gestion de fenêtre
     "cree_fenetre",
     "ferme_fenetre",
+    "redimensionne_fenetre",
     "mise_a_jour",
+    "boucle_evenements",
     # dessin
     "ligne",
     "fleche",
@@ -27,6 +29,7 @@ __all__ = [
     "cercle",
     "point",
     "image",
+    "image_donnees",
     "texte",
     "taille_texte",
     # effacer
@@ -88,6 +91,7 @@ class CustomCanvas:
 
         # binding events
         self.ev_queue = deque()
+        self.listener = None
         self.pressed_keys = set()
         self.events = CustomCanvas._default_ev if events is None else events
         self.bind_events()
@@ -127,12 +131,18 @@ class CustomCanvas:
 
     def event_quit(self):
         self.ev_queue.append(("Quitte", ""))
+        self.notify()
+
+    def notify(self):
+        if self.listener is not None:
+            self.listener()
 
     def bind_event(self, name):
         e_type = CustomCanvas._ev_mapping.get(name, name)
 
         def handler(event, _name=name):
             self.ev_queue.append((_name, event))
+            self.notify()
 
         self.canvas.bind(e_type, handler, "+")
 
@@ -193,6 +203,19 @@ def ferme_fenetre():
     __canevas = None
 
 
+def redimensionne_fenetre(largeur, hauteur):
+    """
+    Change les dimensions de la fenêtre, sans effacer son contenu.
+    """
+    if __canevas is None:
+        raise FenetreNonCree(
+            'La fenêtre n\'a pas été crée avec la fonction "cree_fenetre".'
+        )
+    __canevas.width = largeur
+    __canevas.height = hauteur
+    __canevas.canvas.config(width=largeur, height=hauteur)
+
+
 def mise_a_jour():
     """
     Met à jour la fenêtre. Les dessins ne sont affichés qu'après
@@ -206,6 +229,60 @@ def mise_a_jour():
         __canevas.update()
 
 
+def boucle_evenements(gestionnaire, tache=None, intervalle=0.01):
+    """
+    Traite les événements dès qu'ils arrivent, avec la boucle de tkinter,
+    jusqu'à l'événement 'Quitte' (la fenêtre n'est pas fermée). Contrairement
+    à une boucle appelant ``donne_ev`` et ``mise_a_jour``, rien n'est fait
+    tant qu'aucun événement n'arrive.
+
+    :param callable gestionnaire: fonction appelée avec chaque événement
+    :param callable tache: fonction appelée toutes les ``intervalle``
+        secondes tant qu'elle renvoie `True` (défaut : aucune)
+    :param float intervalle: temps entre deux appels à ``tache``, en secondes
+        (défaut 0.01)
+    """
+    canevas = __canevas
+    if canevas is None:
+        raise FenetreNonCree(
+            'La fenêtre n\'a pas été crée avec la fonction "cree_fenetre".'
+        )
+    erreurs = []
+
+    def arrete(erreur=None):
+        if erreur is not None:
+            erreurs.append(erreur)
+        canevas.listener = None
+        canevas.root.quit()
+
+    def traite():
+        try:
+            while canevas.ev_queue:
+                ev = canevas.ev_queue.popleft()
+                gestionnaire(ev)
+                if type_ev(ev) == "Quitte":
+                    arrete()
+                    return
+        except Exception as erreur:
+            arrete(erreur)
+
+    def repete():
+        try:
+            if canevas.listener is not None and tache():
+                canevas.root.after(round(intervalle * 1000), repete)
+        except Exception as erreur:
+            arrete(erreur)
+
+    canevas.listener = traite
+    if tache is not None:
+        canevas.root.after(0, repete)
+    canevas.root.after(0, traite)
+    canevas.root.mainloop()
+    canevas.listener = None
+    if erreurs:
+        raise erreurs[0]
+
+
 #############################################################################
 # Fonctions de dessin
 #############################################################################
@@ -413,6 +490,31 @@ def image(x, y, fichier, ancrage="center", tag=""):
     return img_object
 
 
+def image_donnees(x, y, donnees, zoom=1, ancrage="nw", tag=""):
+    """
+    Affiche l'image décrite par ``donnees`` avec ``(x, y)`` comme point
+    d'ancrage, sans passer par un fichier. L'image est affichée par un seul
+    objet, quelle que soit sa taille.
+
+    :param float x: abscisse du point d'ancrage
+    :param float y: ordonnée du point d'ancrage
+    :param bytes donnees: contenu d'une image au format PPM (P6) ou PGM (P5)
+    :param int zoom: facteur d'agrandissement de l'image (défaut 1)
+    :param ancrage: position du point d'ancrage par rapport à l'image
+        (défaut 'nw')
+    :param str tag: étiquette d'objet (défaut : pas d'étiquette)
+    :return: identificateur d'objet
+    """
+    tkimage = tk.PhotoImage(data=donnees, format="ppm")
+    if zoom != 1:
+        tkimage = tkimage.zoom(zoom)
+    img_object = __canevas.canvas.create_image(
+        x, y, anchor=ancrage, image=tkimage, tag=tag
+    )
+    __img[img_object] = tkimage
+    return img_object
+
+
 # Texte
 
 
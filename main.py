@@ -5,9 +5,15 @@ def parse_args():
     :rtype: dict
     """
     import argparse
+    import math
 
     parser = argparse.ArgumentParser(description="Bitmap")
-    parser.add_argument("file", help="The file to process")
+    parser.add_argument(
+        "file",
+        nargs="+",
+        help="The file to process (with -batch, the directories, globs and files"
+        " to convert)",
+    )
     parser.add_argument(
         "-information",
         "-i",
@@ -20,9 +26,9 @@ def parse_args():
         "-pixel",
         "-p",
         default=1,
-        type=int,
+        type=float,
         required=False,
-        help="Set pixel size",
+        help="Set pixel size (0 to zoom out until the image fits the window)",
     )
     parser.add_argument(
         "-rotate",
@@ -33,6 +39,31 @@ def parse_args():
         choices={0, 90, 180, 270},
         help="Rotate the image to the left",
     )
+    parser.add_argument(
+        "-renderer",
+        type=str,
+        required=False,
+        default="image",
+        choices={"image", "rectangles", "blocks"},
+        help="Display the image as one image, or as rectangles of pixels of"
+        " the same color (merged by rows, or by blocks of rows)",
+    )
+    parser.add_argument(
+        "-loop",
+        type=str,
+        required=False,
+        default="events",
+        choices={"events", "polling"},
+        help="Only update the window when an event arrives, or look for"
+        " events at every refresh",
+    )
+    parser.add_argument(
+        "-refresh",
+        default=100,
+        type=int,
+        required=False,
+        help="Number of updates of the window per second",
+    )
     parser.add_argument(
         "-convert",
         "-c",
@@ -41,6 +72,63 @@ def parse_args():
         choices={"P" + digit for digit in "123456"},
         help="Choose the final extension of the file",
     )
+    parser.add_argument(
+        "-batch",
+        "-b",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Convert (-c) every file found, with -w processes",
+    )
+    parser.add_argument(
+        "-directory",
+        "-d",
+        type=str,
+        required=False,
+        default=".",
+        help="Choose the folder of the files converted with -batch",
+    )
+    parser.add_argument(
+        "-export",
+        "-e",
+        type=str,
+        required=False,
+        choices={"P" + digit for digit in "123456"},
+        help="Write the image rotated (-r) and zoomed (-p) as displayed, without"
+        " opening a window",
+    )
+    parser.add_argument(
+        "-lazy",
+        "-l",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Memory-map binary files and decode rows only when needed",
+    )
+    parser.add_argument(
+        "-progressive",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Open the window at once and display the image while it is"
+        " being decoded",
+    )
+    parser.add_argument(
+        "-workers",
+        "-w",
+        default=1,
+        type=int,
+        required=False,
+        help="Number of processes used to decode ascii files, or to convert"
+        " files with -batch",
+    )
+    parser.add_argument(
+        "-cache",
+        type=str,
+        required=False,
+        default=None,
+        help="Directory where decoded pictures are cached",
+    )
     parser.add_argument(
         "-output",
         "-o",
@@ -49,26 +137,151 @@ def parse_args():
         default="newImage",
         help="Choose the name of the converted file",
     )
-    return vars(parser.parse_args())
+    args = vars(parser.parse_args())
+    if args["batch"]:
+        if args["convert"] is None:
+            parser.error("-batch needs the version to convert to (-convert)")
+    elif len(args["file"]) > 1:
+        parser.error("only one file can be processed without -batch")
+    else:
+        args["file"] = args["file"][0]
+    if not 0 <= args["pixel"] < math.inf:
+        parser.error("the pixel size (-pixel) must be positive, or 0")
+    if args["export"] is not None and args["pixel"] <= 0:
+        # there is no window for the image to fit in
+        parser.error("-export needs a positive pixel size (-pixel)")
+    return args
 
 
-if __name__ == "__main__":
+def open_cache(args: dict):
+    """Open the cache of decoded pictures given on the command line
+
+    :param args: command line arguments
+    :type args: dict
+    :return: the cache, None if no cache is used
+    :rtype: RasterCache | None
+    """
+    if args["cache"] is None:
+        return None
+    from cache import RasterCache
+
+    return RasterCache(args["cache"])
+
+
+def open_file(args: dict, cache=None):
+    """Parse the file given on the command line, with the requested options
+
+    :param args: command line arguments
+    :type args: dict
+    :param cache: cache of decoded pictures, defaults to None
+    :type cache: RasterCache, optional
+    :return: the parsed file
+    :rtype: Parser
+    """
     from parser import Parser
 
+    return Parser(args["file"], args["lazy"], workers=args["workers"], cache=cache)
+
+
+def convert_batch(args: dict):
+    """Convert the files given on the command line, showing the progress, the
+    errors and the throughput of the conversion
+
+    :param args: command line arguments
+    :type args: dict
+    """
+    import time
+
+    from batch import convert_files, find_files
+
+    filenames = find_files(args["file"])
+    if not filenames:
+        print("No file to convert.")
+        return
+    start = time.perf_counter()
+    converted = total_size = 0
+    results = convert_files(
+        filenames, args["convert"], args["directory"], args["workers"]
+    )
+    for count, (filename, file_name, size, error) in enumerate(results, 1):
+        progress = f"[{count}/{len(filenames)}] {filename}"
+        if error is None:
+            converted += 1
+            total_size += size
+            print(f"{progress} -> {file_name}")
+        else:
+            print(f"{progress}: {error}")
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print(
+        f"{converted} of {len(filenames)} files converted in {elapsed:.2f} s"
+        f" ({total_size / elapsed / 1e6:.2f} MB/s,"
+        f" {converted / elapsed:.2f} files/s)"
+    )
+
+
+if __name__ == "__main__":
     args = parse_args()
-    file = Parser(args["file"])
-    if args["information"]:
-        for key, value in args.items():
-            if key != "picture":
-                print(f" {key}: {value}")
+    if args["batch"]:
+        convert_batch(args)
+    elif args["information"]:
+        from parser import probe
+
+        for key, value in probe(args["file"]).items():
+            print(f" {key}: {value}")
     elif args["convert"] is not None:
         from writer import Writer
 
-        writer = Writer(file, args["convert"], args["output"])
+        from parser import Parser
+
+        if args["cache"] is not None or args["lazy"] or args["workers"] > 1:
+            # the options of the decoding win over streaming
+            infos = open_file(args, open_cache(args))
+        else:
+            # rows are converted while they are read, without decoding the
+            # whole picture
+            infos = Parser(args["file"], stream=True)
+        writer = Writer(infos, args["convert"], args["output"])
         writer.write()
+        print(f"The file {writer.file_name} has been successfully created.")
+    elif args["export"] is not None:
+        from render import export
+
+        file_name = export(
+            open_file(args, open_cache(args)),
+            args["export"],
+            args["output"],
+            args["rotate"],
+            args["pixel"],
+        )
+        print(f"The file {file_name} has been successfully created.")
     else:
         from bitmap import Bitmap
+        from pyramid import Pyramid
+
+        if args["progressive"]:
+            from parser import Parser
 
-        window = Bitmap(file, args["pixel"], args["rotate"])
+            window = Bitmap(
+                Parser(args["file"], stream=True),
+                args["pixel"],
+                args["rotate"],
+                args["renderer"],
+                loop=args["loop"],
+                refresh_rate=args["refresh"],
+            )
+        else:
+            cache = open_cache(args)
+            infos = open_file(args, cache)
+            window = Bitmap(
+                infos,
+                args["pixel"],
+                args["rotate"],
+                args["renderer"],
+                pyramid=Pyramid(infos["picture"], cache, args["file"]),
+                loop=args["loop"],
+                refresh_rate=args["refresh"],
+            )
         window.build()
-        print("The file {window.file_name} has been successfully created.")
+        if window.drawn_rectangles is not None:
+            items, pixels = window.drawn_rectangles
+            print(f"{items} rectangles drawn for {pixels} pixels")
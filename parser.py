@@ -1,11 +1,45 @@
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import tables
+import vectorized
+from picture import LazyPicture, Picture, WidePicture, index_colors
+
+WHITESPACES = b" \t\n\v\f\r"
+CHUNK_SIZE = 1 << 16
+# versions which can be found in the files of each extension
+VERSIONS = {".pbm": {"P1", "P4"}, ".pgm": {"P2", "P5"}, ".ppm": {"P3", "P6"}}
+
+
 class Parser:
     """Parser object to parse pbm, pgm and ppm file (ascii and binary)"""
 
-    def __init__(self, filename: str):
+    def __init__(
+        self,
+        filename: str,
+        lazy: bool = False,
+        stream: bool = False,
+        workers: int = 1,
+        cache=None,
+    ):
         """Initalisation
 
         :param filename: Path of the ppm file to parse
         :type filename: str
+        :param lazy: memory-map binary files (P4, P5 and P6) and decode their
+            rows only when they are accessed, defaults to False
+        :type lazy: bool, optional
+        :param stream: only read the header, the rows being then decoded one
+            at a time by `iter_rows`, defaults to False
+        :type stream: bool, optional
+        :param workers: number of processes decoding ascii files (P1, P2 and
+            P3) in parallel, defaults to 1
+        :type workers: int, optional
+        :param cache: cache of decoded pictures, used when the file is not
+            parsed lazily, defaults to None
+        :type cache: RasterCache, optional
         :raises ValueError: Error raised when file is not a ppm file
         """
         available_format = {".pbm", ".pgm", ".ppm"}
@@ -13,20 +47,32 @@ class Parser:
         if extension not in available_format:
             raise ValueError("File is not a bitmap file")
         self.filename = filename
+        self.lazy = lazy
+        self.workers = workers
         self.infos = {
             "file version": None,
             "size": None,
             "maximum color value": None,
-            "picture": [
-                [],
-            ],
+            "picture": None,
         }
+        if stream:
+            with open(filename, "rb") as file:
+                self.read_header(file, 3 if extension == ".pbm" else 4)
+            return
+        use_cache = cache is not None and not lazy
+        if use_cache:
+            infos = cache.load(filename)
+            if infos is not None:
+                self.infos = infos
+                return
         parse = {
             ".pbm": self.parse_pbm,
             ".pgm": self.parse_pgm,
             ".ppm": self.parse_ppm,
         }
         parse[extension]()
+        if use_cache:
+            cache.store(filename, self.infos)
 
     def __setitem__(self, key: str, value):
         """Change the value of `self.infos` dictionnary
@@ -48,24 +94,252 @@ class Parser:
         """
         return self.infos[key]
 
-    def remove_comments(self, string):
-        """Remove comments of a given string
-        In ppm file format, comments starts with '#'
+    def read_header(self, file, fields: int):
+        """Read the header of a file, byte by byte, and fill `self.infos`
+        The file is left positioned on the first byte of the raster, so that
+        binary rasters can be read in one call even if they contain bytes
+        looking like newlines or comments.
+
+        :param file: the file opened in binary mode, positioned at its start
+        :type file: BufferedReader
+        :param fields: number of header fields (3 for pbm, 4 otherwise)
+        :type fields: int
+        :raises ValueError: the header is incomplete, or its version, size or
+            maximum color value is invalid
+        """
+        self["maximum color value"] = 1
+        tokens = []
+        token = b""
+        while len(tokens) < fields:
+            car = file.read(1)
+            if car == b"":
+                raise ValueError("File header is incomplete")
+            if car == b"#":
+                # a comment lasts until the end of its line
+                file.readline()
+                car = b"\n"
+            if car in WHITESPACES:
+                if token != b"":
+                    tokens.append(token)
+                    token = b""
+            else:
+                token += car
+        version = tokens[0].decode(errors="replace")
+        if version not in VERSIONS[self.filename[-4:]]:
+            raise ValueError("The version does not match the file extension")
+        self["file version"] = version
+        width, height = int(tokens[1]), int(tokens[2])
+        if width <= 0 or height <= 0:
+            raise ValueError("The size of the image must be positive")
+        self["size"] = (width, height)
+        if fields == 4:
+            maximum = int(tokens[3])
+            if not 0 < maximum < 65536:
+                raise ValueError("The maximum color value must be between 1 and 65535")
+            self["maximum color value"] = maximum
+        self.offset = file.tell()
+
+    def read_raster(self, file, size: int):
+        """Read the binary raster of a file in one call
+
+        :param file: the file, positioned at the start of the raster
+        :type file: BufferedReader
+        :param size: the number of bytes of the raster
+        :type size: int
+        :raises ValueError: the file is shorter than its header claims
+        :return: the raster
+        :rtype: bytes
+        """
+        raster = file.read(size)
+        if len(raster) != size:
+            raise ValueError("File is truncated")
+        return raster
+
+    def iter_text(self, file):
+        """Read an ascii raster by chunks, each chunk ending on a whitespace
+        so that no number is cut in two
+
+        :param file: the file, positioned at the start of the raster
+        :type file: BufferedReader
+        :yield: the chunks of the raster
+        :rtype: Iterator[bytes]
+        """
+        pending = b""
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if chunk == b"":
+                yield pending
+                return
+            text = pending + chunk
+            cut = max(text.rfind(WHITESPACES[i : i + 1]) for i in range(6)) + 1
+            pending = text[cut:]
+            yield text[:cut]
+
+    def decode_text(self, text: bytes):
+        """Decode the samples of (a part of) an ascii raster
+
+        :param text: whitespace separated samples
+        :type text: bytes
+        :return: the samples, rebalanced between 0 and 255, or kept as they
+            are if the maximum color value is above 255
+        :rtype: bytearray | array.array
+        """
+        maximum = self["maximum color value"]
+        if self["file version"] == "P1":
+            # digits of a P1 raster do not need to be separated by whitespaces
+            return bytearray(text.translate(tables.text_bits_table(), WHITESPACES))
+        if maximum > 255:
+            if vectorized.AVAILABLE:
+                samples = vectorized.decode_ascii(text)
+                if samples.size and (samples.min() < 0 or samples.max() > maximum):
+                    raise ValueError("A sample is out of the maximum color value")
+                return array("H", samples.astype("uint16").tobytes())
+            return tables.wide_samples(map(int, text.split()), maximum)
+        if vectorized.AVAILABLE:
+            return bytearray(vectorized.scale(vectorized.decode_ascii(text), maximum))
+        return tables.scale(map(int, text.split()), maximum)
+
+    def read_text(self, file):
+        """Read and decode a whole ascii raster, with `self.workers` processes
+        if the raster is big enough to be split
+
+        :param file: the file, positioned at the start of the raster
+        :type file: BufferedReader
+        :return: the samples (see `decode_text`)
+        :rtype: bytearray | array.array
+        """
+        size = os.fstat(file.fileno()).st_size - self.offset
+        count = min(self.workers * 4, size // CHUNK_SIZE)
+        if self.workers <= 1 or count <= 1:
+            return self.decode_text(file.read())
+        bounds = self.chunk_bounds(file, count)
+        with ProcessPoolExecutor(self.workers) as pool:
+            parts = pool.map(self.decode_range, bounds[:-1], bounds[1:])
+            samples = next(parts)
+            for part in parts:
+                samples += part
+            return samples
+
+    def chunk_bounds(self, file, count: int):
+        """Split an ascii raster in chunks of about the same size, every
+        chunk starting right after a whitespace
+
+        :param file: the file to split
+        :type file: BufferedReader
+        :param count: the number of chunks
+        :type count: int
+        :return: the offsets where chunks start, followed by the end of file
+        :rtype: list[int]
+        """
+        end = os.fstat(file.fileno()).st_size
+        bounds = [self.offset]
+        for index in range(1, count):
+            position = self.offset + (end - self.offset) * index // count
+            if position <= bounds[-1]:
+                continue
+            file.seek(position)
+            car = file.read(1)
+            while car != b"" and car not in WHITESPACES:
+                car = file.read(1)
+            bounds.append(file.tell())
+        bounds.append(end)
+        return bounds
+
+    def decode_range(self, start: int, end: int):
+        """Read and decode a chunk of an ascii raster (run by the workers)
+
+        :param start: offset of the chunk in the file
+        :type start: int
+        :param end: offset of the end of the chunk in the file
+        :type end: int
+        :return: the samples of the chunk (see `decode_text`)
+        :rtype: bytearray | array.array
+        """
+        with open(self.filename, "rb") as file:
+            file.seek(start)
+            return self.decode_text(file.read(end - start))
+
+    def iter_rows(self, wide: bool = False):
+        """Decode the rows of the image one after the other.
+        Unless the picture has already been parsed, the rows are read from the
+        file as they are needed, so that memory stays bounded by one row.
+
+        :param wide: give the samples as they are in the file when its
+            maximum color value is above 255, instead of rebalancing them
+            between 0 and 255, defaults to False
+        :type wide: bool, optional
+        :raises ValueError: the file is shorter than its header claims
+        :yield: the `width * channels` samples of each row
+        :rtype: Iterator[bytearray | memoryview | array.array]
+        """
+        maximum = self["maximum color value"]
+        wide = wide and maximum > 255
+        picture = self["picture"]
+        if picture is not None:
+            row = picture.wide_row if wide else picture.row
+            for y in range(picture.height):
+                yield row(y)
+            return
+        width, height = self["size"]
+        version = int(self["file version"][1])
+        row_size = width * (3 if version in {3, 6} else 1)
+        with open(self.filename, "rb") as file:
+            file.seek(self.offset)
+            if version >= 4:
+                if version == 4:
+                    raw_row_size, decode = (width + 7) // 8, self.unpack_bits
+                elif maximum > 255:
+                    raw_row_size = 2 * row_size
+                    decode = self.wide_samples if wide else self.narrow_samples
+                else:
+                    raw_row_size, decode = row_size, self.scale_samples
+                for _ in range(height):
+                    yield decode(self.read_raster(file, raw_row_size))
+                return
+            rows = 0
+            pending = array("H") if maximum > 255 else bytearray()
+            for text in self.iter_text(file):
+                pending += self.decode_text(text)
+                while len(pending) >= row_size and rows < height:
+                    row = pending[:row_size]
+                    yield row if wide or maximum <= 255 else tables.scale(row, maximum)
+                    del pending[:row_size]
+                    rows += 1
+            if rows < height:
+                raise ValueError("File is truncated")
 
-        :param string: The string that may contain comments
-        :type string: str
-        :return: string without comments
-        :rtype: str
+    def map_raster(
+        self, file, raw_row_size: int, channels: int, decode=None, wide_decode=None
+    ):
+        """Memory-map the binary raster of a file instead of reading it
 
-        >>> remove_comments('P4')
-        'P4'
-        >>> remove_comments('P4#version')
-        'P4'
+        :param file: the file, positioned at the start of the raster
+        :type file: BufferedReader
+        :param raw_row_size: number of bytes of a row in the file
+        :type raw_row_size: int
+        :param channels: number of samples per pixel
+        :type channels: int
+        :param decode: function turning a raw row into samples, defaults to
+            None (the raw rows are already samples)
+        :type decode: callable, optional
+        :param wide_decode: function turning a raw row into 16-bit samples,
+            for files whose maximum color value is above 255, defaults to None
+        :type wide_decode: callable, optional
+        :raises ValueError: the file is shorter than its header claims
+        :return: the picture, whose rows are decoded on access
+        :rtype: LazyPicture
         """
-        for index, car in enumerate(string):
-            if car == "#":
-                return string[:index]
-        return string
+        width, height = self["size"]
+        offset = file.tell()
+        size = raw_row_size * height
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < offset + size:
+            raise ValueError("File is truncated")
+        raw = memoryview(mapped)[offset : offset + size]
+        maximum = self["maximum color value"] if wide_decode is not None else 255
+        return LazyPicture(
+            width, height, channels, raw, raw_row_size, decode, maximum, wide_decode
+        )
 
     def parse_pbm(self):
         """Parse .pbm file.
@@ -86,55 +360,38 @@ class Parser:
         0 0 1 1 1 0 0
         0 0 0 0 0 0 0
         ```
+        1 represents a black pixel and 0 a white one.
         """
-        self["maximum color value"] = 1
-        last_instruction = 0
-        current_width = 0
         with open(self.filename, "rb") as file:
-            for line in file:
-                if last_instruction < 2:
-                    line = self.remove_comments(line.decode("utf-8").rstrip())
-                    if last_instruction == 0 and line != "":
-                        self["file version"] = line
-                        last_instruction += 1
-                    elif last_instruction == 1 and line != "":
-                        self["size"] = tuple(map(int, line.split()))
-                        width = self["size"][0]
-                        last_instruction += 1
-                else:
-                    if int(self["file version"][1]) <= 3:
-                        for car in line.decode().split():
-                            if current_width == width:
-                                current_width = 0
-                                self["picture"].append([])
-                            if car == "0":
-                                self["picture"][-1].append([0, 0, 0])
-                            else:
-                                self["picture"][-1].append([255, 255, 255])
-                            current_width += 1
-                    else:
-                        for byte in list(line):
-                            b = bin(byte)[2:]
-                            if len(b) < 8:
-                                b = "0" * (8 - len(b)) + b
-                            for nb in b:
-                                if current_width == width:
-                                    current_width = 0
-                                    self["picture"].append([])
-                                    break
-                                    # This break is very VERY important.
-                                    # If the byte number is 65, its '1000001'
-                                    # in binary (so '01000001' because we are
-                                    # working on 8 bits). But if the width is
-                                    # 52 and current width is 48, we just have
-                                    # to proceed for the first four bit,
-                                    # which are '0100', and don't continue
-                                    # by adding to the next line '0001'
-                                if nb == "0":
-                                    self["picture"][-1].append([0, 0, 0])
-                                else:
-                                    self["picture"][-1].append([255, 255, 255])
-                                current_width += 1
+            self.read_header(file, 3)
+            width, height = self["size"]
+            if int(self["file version"][1]) <= 3:
+                samples = self.read_text(file)
+            else:
+                # each row is padded to a whole number of bytes
+                row_bytes = (width + 7) // 8
+                if self.lazy:
+                    self["picture"] = self.map_raster(
+                        file, row_bytes, 1, self.unpack_bits
+                    )
+                    return
+                raster = self.read_raster(file, row_bytes * height)
+                samples = self.unpack_bits(raster, height)
+        self["picture"] = Picture(width, height, 1, samples)
+
+    def unpack_bits(self, raw, height: int = 1):
+        """Unpack rows of a P4 raster, one bit per pixel, 1 being black
+
+        :param raw: the bytes of the rows, including their padding bits
+        :type raw: bytes
+        :param height: the number of rows, defaults to 1
+        :type height: int, optional
+        :return: the samples of the rows (0 or 255)
+        :rtype: bytearray
+        """
+        if vectorized.AVAILABLE:
+            return bytearray(vectorized.unpack_bits(raw, self["size"][0], height))
+        return tables.unpack_bits(raw, self["size"][0], height)
 
     def parse_pgm(self):
         """Parse .pgm file.
@@ -154,34 +411,7 @@ class Parser:
         0 0 0 0 0 0 0 0 0 0 0 0 0  0  0  0  0 0 0  0  0  0  0 0
         ```
         """
-        last_instruction = 0
-        current_width = 0
-        with open(self.filename, "rb") as file:
-            for line in file:
-                if last_instruction < 3:
-                    line = self.remove_comments(line.decode("utf-8").rstrip())
-                    if last_instruction == 0 and line != "":
-                        self["file version"] = line
-                        last_instruction += 1
-                    elif last_instruction == 1 and line != "":
-                        self["size"] = tuple(map(int, line.split()))
-                        width = self["size"][0]
-                        last_instruction += 1
-                    elif last_instruction == 2 and line != "":
-                        self["maximum color value"] = int(line)
-                        last_instruction += 1
-                else:
-                    if int(self["file version"][1]) <= 3:
-                        iterable = line.decode().rstrip().split()
-                    else:
-                        iterable = list(line)
-                    for car in iterable:
-                        if current_width == width:
-                            current_width = 0
-                            self["picture"].append([])
-                        b = self.balance(int(car), self["maximum color value"])
-                        self["picture"][-1].append([b, b, b])
-                        current_width += 1
+        self.parse_samples(1)
 
     def parse_ppm(self):
         """Parse .ppm file.
@@ -198,40 +428,91 @@ class Parser:
         0 20  0    0  0  0    0  0  0    0  0  0
         ```
         """
-        last_instruction = 0
-        current_width = 0
+        self.parse_samples(3)
+
+    def parse_samples(self, channels: int):
+        """Parse the header and the samples of a pgm or ppm file
+
+        :param channels: number of samples per pixel (1 for pgm, 3 for ppm)
+        :type channels: int
+        """
         with open(self.filename, "rb") as file:
-            for line in file:
-                if last_instruction < 3:
-                    line = self.remove_comments(line.decode("utf-8").rstrip())
-                    if last_instruction == 0 and line != "":
-                        self["file version"] = line
-                        last_instruction += 1
-                    elif last_instruction == 1 and line != "":
-                        self["size"] = tuple(map(int, line.split()))
-                        width = self["size"][0]
-                        last_instruction += 1
-                    elif last_instruction == 2 and line != "":
-                        self["maximum color value"] = int(line)
-                        last_instruction += 1
+            self.read_header(file, 4)
+            width, height = self["size"]
+            maximum = self["maximum color value"]
+            # samples take two bytes in binary rasters above 255
+            sample_size = 2 if maximum > 255 else 1
+            if int(self["file version"][1]) <= 3:
+                samples = self.read_text(file)
+            elif self.lazy:
+                raw_row_size = width * channels * sample_size
+                if maximum > 255:
+                    # the samples are also given as they are, see `wide_row`
+                    self["picture"] = self.map_raster(
+                        file,
+                        raw_row_size,
+                        channels,
+                        self.narrow_samples,
+                        self.wide_samples,
+                    )
+                    return
+                decode = None if maximum == 255 else self.scale_samples
+                self["picture"] = self.map_raster(file, raw_row_size, channels, decode)
+                return
+            else:
+                size = width * height * channels * sample_size
+                raster = self.read_raster(file, size)
+                if maximum > 255:
+                    samples = self.wide_samples(raster)
                 else:
-                    if int(self["file version"][1]) <= 3:
-                        iterable = line.decode().rstrip().split()
-                    else:
-                        iterable = list(line)
-                    temp = []
-                    rgb_counter = 0
-                    for car in iterable:
-                        if current_width == width:
-                            current_width = 0
-                            self["picture"].append([])
-                        temp.append(self.balance(int(car), self["maximum color value"]))
-                        rgb_counter += 1
-                        if rgb_counter == 3:
-                            rgb_counter = 0
-                            self["picture"][-1].append(temp)
-                            current_width += 1
-                            temp = []
+                    samples = self.scale_samples(raster)
+        if maximum > 255:
+            self["picture"] = WidePicture(width, height, channels, samples, maximum)
+            return
+        picture = Picture(width, height, channels, samples)
+        # pictures with few colors are kept as a palette and indexes
+        indexed = index_colors(picture)
+        self["picture"] = picture if indexed is None else indexed
+
+    def scale_samples(self, raw):
+        """Rebalance binary samples to get their values between 0 and 255
+
+        :param raw: the samples, as stored in the file
+        :type raw: bytes
+        :return: the rebalanced samples
+        :rtype: bytearray
+        """
+        maximum = self["maximum color value"]
+        if maximum == 255:
+            return bytearray(raw)
+        if vectorized.AVAILABLE:
+            return bytearray(vectorized.scale(raw, maximum))
+        return tables.scale(raw, maximum)
+
+    def wide_samples(self, raw):
+        """Read the 16-bit samples of a binary raster whose maximum color
+        value is above 255, swapping their bytes in bulk if needed
+
+        :param raw: the samples, as stored in the file
+        :type raw: bytes
+        :return: the samples, two bytes each
+        :rtype: array.array
+        """
+        return tables.wide_samples(raw, self["maximum color value"])
+
+    def narrow_samples(self, raw):
+        """Rebalance the 16-bit samples of a binary raster between 0 and 255
+
+        :param raw: the samples, as stored in the file
+        :type raw: bytes
+        :return: the rebalanced samples
+        :rtype: bytearray
+        """
+        maximum = self["maximum color value"]
+        samples = self.wide_samples(raw)
+        if vectorized.AVAILABLE:
+            return bytearray(vectorized.scale(samples, maximum))
+        return tables.scale(samples, maximum)
 
     def balance(self, n: int, max_value: int = 1):
         """Rebalance a number to get its value between 0 and 255
@@ -244,4 +525,50 @@ class Parser:
         :return: the rebalanced number
         :rtype: int
         """
-        return int((n / max_value) * 255)
+        return tables.scale_table(max_value)[n]
+
+
+def probe(filename: str):
+    """Read only the header of a file, whatever its size
+
+    :param filename: Path of the ppm file
+    :type filename: str
+    :raises ValueError: the file is not a ppm file or its header is invalid
+    :return: the version, size and maximum color value of the file, with the
+        offset of the raster and its expected size in bytes (None for ascii
+        rasters, whose size depends on how the numbers are written)
+    :rtype: dict
+    """
+    parser = Parser(filename, stream=True)
+    infos = {key: value for key, value in parser.infos.items() if key != "picture"}
+    width, height = parser["size"]
+    version = int(parser["file version"][1])
+    if version == 4:
+        size = (width + 7) // 8 * height
+    elif version in {5, 6}:
+        sample_size = 1 if parser["maximum color value"] < 256 else 2
+        size = width * height * (3 if version == 6 else 1) * sample_size
+    else:
+        size = None
+    infos["raster offset"] = parser.offset
+    infos["raster size"] = size
+    return infos
+
+
+def probe_many(filenames):
+    """Read only the header of many files, for inventories.
+    A file that cannot be probed does not stop the others: its error message
+    is given instead of its header, under the "error" key.
+
+    :param filenames: Paths of the ppm files
+    :type filenames: Iterable[str]
+    :return: the header of each file (see `probe`), by file name
+    :rtype: dict[str, dict]
+    """
+    headers = {}
+    for filename in filenames:
+        try:
+            headers[filename] = probe(filename)
+        except (OSError, ValueError) as error:
+            headers[filename] = {"error": str(error)}
+    return headers
@@ -0,0 +1,722 @@
+from array import array
+
+import tables
+import vectorized
+
+
+class Picture:
+    """Packed raster of an image.
+
+    Samples are stored row by row in one contiguous buffer, with `channels`
+    samples per pixel (3 for RGB images, 1 for gray scale and black and
+    white images).
+    """
+
+    # maximum value of the samples given by `row` and `buffer`
+    maximum = 255
+
+    def __init__(self, width: int, height: int, channels: int = 3, data=None):
+        """Initialisation
+
+        :param width: width of the image, in pixels
+        :type width: int
+        :param height: height of the image, in pixels
+        :type height: int
+        :param channels: number of samples per pixel (1 or 3), defaults to 3
+        :type channels: int, optional
+        :param data: the packed samples, defaults to a black image
+        :type data: bytearray, optional
+        :raises ValueError: the buffer size does not match the image size
+        """
+        if channels not in {1, 3}:
+            raise ValueError("A picture has either 1 or 3 channels")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.row_size = width * channels
+        if data is None:
+            data = bytearray(self.row_size * height)
+        if len(data) != self.row_size * height:
+            raise ValueError("The buffer size does not match the picture size")
+        self.data = data
+
+    def __len__(self):
+        """Number of rows of the picture"""
+        return self.height
+
+    def buffer(self):
+        """Give a read-only view over the whole packed raster
+
+        :return: the packed samples
+        :rtype: memoryview
+        """
+        return memoryview(self.data).toreadonly()
+
+    def pnm(self):
+        """Give the content of a binary PPM (P6) or PGM (P5) file holding the
+        picture, for instance to display it without writing a file
+
+        :return: the header followed by the samples
+        :rtype: bytes
+        """
+        version = "P6" if self.channels == 3 else "P5"
+        header = f"{version}\n{self.width} {self.height}\n255\n".encode()
+        return header + self.buffer()
+
+    def crop(self, x: int, y: int, width: int, height: int):
+        """Copy a rectangular part of the picture, row by row
+
+        :param x: abscissa of the top left corner of the part
+        :type x: int
+        :param y: ordinate of the top left corner of the part
+        :type y: int
+        :param width: width of the part (reduced if it exceeds the picture)
+        :type width: int
+        :param height: height of the part (reduced if it exceeds the picture)
+        :type height: int
+        :return: the part of the picture
+        :rtype: Picture
+        """
+        width = min(width, self.width - x)
+        height = min(height, self.height - y)
+        start, end = x * self.channels, (x + width) * self.channels
+        samples = bytearray().join(
+            self.row(row)[start:end] for row in range(y, y + height)
+        )
+        return Picture(width, height, self.channels, samples)
+
+    def paste(self, part, x: int, y: int):
+        """Copy a picture into this one, row by row
+
+        :param part: the picture to copy, with the same number of channels and
+            fitting in this one
+        :type part: Picture
+        :param x: abscissa of the top left corner of the copy
+        :type x: int
+        :param y: ordinate of the top left corner of the copy
+        :type y: int
+        """
+        start = x * self.channels
+        for row in range(part.height):
+            offset = (y + row) * self.row_size + start
+            self.data[offset : offset + part.row_size] = part.row(row)
+
+    def rotate(self, angle: int):
+        """Rotate the picture to the left, with slices of the whole buffer
+        rather than pixel by pixel
+
+        :param angle: the rotation angle (0, 90, 180 or 270)
+        :type angle: int
+        :raises ValueError: the angle is not a multiple of 90
+        :return: the rotated picture (the picture itself for 0)
+        :rtype: Picture
+        """
+        if angle not in {0, 90, 180, 270}:
+            raise ValueError("A picture can only be rotated by a right angle")
+        if angle == 0:
+            return self
+        data = self.buffer()
+        if vectorized.AVAILABLE:
+            samples = vectorized.rotate(
+                data, self.channels, self.width, self.height, angle
+            )
+        else:
+            samples = bytearray(len(data))
+            channels, width, height = self.channels, self.width, self.height
+            if angle == 180:
+                for channel in range(channels):
+                    samples[channel::channels] = data[channel::channels][::-1]
+            else:
+                # each row of the rotated picture is a column of this one
+                size = height * channels
+                for y in range(width):
+                    x = width - 1 - y if angle == 90 else y
+                    for channel in range(channels):
+                        column = data[x * channels + channel :: self.row_size]
+                        if angle == 270:
+                            column = column[::-1]
+                        start = y * size + channel
+                        samples[start : start + size : channels] = column
+        if angle == 180:
+            return Picture(self.width, self.height, self.channels, samples)
+        return Picture(self.height, self.width, self.channels, samples)
+
+    def halve(self):
+        """Reduce the picture to half its size, each pixel being the average
+        of a block of 2x2 pixels (the last row and column are repeated when
+        the size is odd)
+
+        :return: the reduced picture
+        :rtype: Picture
+        """
+        channels = self.channels
+        width, height = -(-self.width // 2), -(-self.height // 2)
+        if vectorized.AVAILABLE:
+            samples = vectorized.halve(
+                self.buffer(), channels, self.width, self.height
+            )
+            return Picture(width, height, channels, samples)
+        samples = bytearray(width * height * channels)
+        size = width * channels
+        step = 2 * channels
+        for y in range(height):
+            top = self.row(2 * y)
+            bottom = self.row(min(2 * y + 1, self.height - 1))
+            if self.width % 2:
+                top = bytes(top) + top[-channels:]
+                bottom = bytes(bottom) + bottom[-channels:]
+            for channel in range(channels):
+                start = y * size + channel
+                samples[start : start + size : channels] = bytes(
+                    map(
+                        lambda a, b, c, d: (a + b + c + d + 2) >> 2,
+                        top[channel::step],
+                        top[channel + channels :: step],
+                        bottom[channel::step],
+                        bottom[channel + channels :: step],
+                    )
+                )
+        return Picture(width, height, channels, samples)
+
+    def resize(self, width: int, height: int):
+        """Resize the picture, each pixel taking the color of the nearest
+        pixel of the picture. Rows are built once and repeated as a whole
+        when the picture is enlarged.
+
+        :param width: width of the resized picture
+        :type width: int
+        :param height: height of the resized picture
+        :type height: int
+        :return: the resized picture
+        :rtype: Picture
+        """
+        channels = self.channels
+        if vectorized.AVAILABLE:
+            samples = vectorized.resize(
+                self.buffer(), channels, self.width, self.height, (width, height)
+            )
+            return Picture(width, height, channels, samples)
+        indexes = [
+            x * self.width // width * channels + channel
+            for x in range(width)
+            for channel in range(channels)
+        ]
+        rows = []
+        source = None
+        for y in range(height):
+            if y * self.height // height != source:
+                source = y * self.height // height
+                row = bytes(self.row(source))
+                samples = bytes(map(row.__getitem__, indexes))
+            rows.append(samples)
+        return Picture(width, height, channels, bytearray().join(rows))
+
+    def row(self, y: int):
+        """Give a read-only view over the samples of a row
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row
+        :rtype: memoryview
+        """
+        start = y * self.row_size
+        return self.buffer()[start : start + self.row_size]
+
+    def pixel(self, x: int, y: int):
+        """Give the samples of a pixel
+
+        :param x: abscissa of the pixel
+        :type x: int
+        :param y: ordinate of the pixel
+        :type y: int
+        :return: the `channels` samples of the pixel
+        :rtype: tuple[int]
+        """
+        start = y * self.row_size + x * self.channels
+        return tuple(self.data[start : start + self.channels])
+
+    def rgb(self, x: int, y: int):
+        """Give the color of a pixel, whatever the number of channels
+
+        :param x: abscissa of the pixel
+        :type x: int
+        :param y: ordinate of the pixel
+        :type y: int
+        :return: the red, green and blue values of the pixel
+        :rtype: tuple[int, int, int]
+        """
+        samples = self.pixel(x, y)
+        if self.channels == 1:
+            return samples * 3
+        return samples
+
+
+class LazyPicture(Picture):
+    """Picture backed by the raw raster of a file (usually memory-mapped).
+
+    Nothing is decoded up front: rows are decoded only when they are
+    accessed. When the raw samples need no decoding, rows are zero-copy views
+    over the raster.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        channels: int,
+        raw: memoryview,
+        raw_row_size: int,
+        decode=None,
+        maximum: int = 255,
+        wide_decode=None,
+    ):
+        """Initialisation
+
+        :param width: width of the image, in pixels
+        :type width: int
+        :param height: height of the image, in pixels
+        :type height: int
+        :param channels: number of samples per pixel (1 or 3)
+        :type channels: int
+        :param raw: the raw raster, as stored in the file
+        :type raw: memoryview
+        :param raw_row_size: number of bytes of a row in the raw raster
+        :type raw_row_size: int
+        :param decode: function turning a raw row into its `width * channels`
+            samples, defaults to None (raw rows are already samples)
+        :type decode: callable, optional
+        :param maximum: the maximum color value of the file, defaults to 255
+        :type maximum: int, optional
+        :param wide_decode: function turning a raw row into its samples as in
+            the file, for files whose maximum color value is above 255 (see
+            `wide_row`), defaults to None
+        :type wide_decode: callable, optional
+        :raises ValueError: the raw raster size does not match the image size
+        """
+        if channels not in {1, 3}:
+            raise ValueError("A picture has either 1 or 3 channels")
+        if len(raw) != raw_row_size * height:
+            raise ValueError("The buffer size does not match the picture size")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.row_size = width * channels
+        self.raw = raw
+        self.raw_row_size = raw_row_size
+        self.decode = decode
+        self.maximum = maximum
+        self.wide_decode = wide_decode
+        self.last_row = (None, None)
+
+    def buffer(self):
+        """Give a read-only view over the whole packed raster
+        This decodes every row if the raw raster is not made of samples.
+
+        :return: the packed samples
+        :rtype: memoryview
+        """
+        if self.decode is None:
+            return self.raw.toreadonly()
+        return memoryview(b"".join(self.row(y) for y in range(self.height)))
+
+    def raw_row(self, y: int):
+        """Give a zero-copy view over a row of the raw raster
+
+        :param y: the index of the row
+        :type y: int
+        :return: the raw bytes of the row
+        :rtype: memoryview
+        """
+        start = y * self.raw_row_size
+        return self.raw[start : start + self.raw_row_size]
+
+    def row(self, y: int):
+        """Give a read-only view over the samples of a row, decoding it if
+        needed. The last decoded row is kept, so that pixels of a same row
+        can be accessed one after the other.
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row
+        :rtype: memoryview
+        """
+        if self.decode is None:
+            return self.raw_row(y).toreadonly()
+        index, samples = self.last_row
+        if index != y:
+            samples = memoryview(self.decode(self.raw_row(y))).toreadonly()
+            self.last_row = (y, samples)
+        return samples
+
+    def wide_row(self, y: int):
+        """Give a read-only view over the samples of a row of a file whose
+        maximum color value is above 255, as in the file
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row, up to `maximum`
+        :rtype: memoryview
+        """
+        return memoryview(self.wide_decode(self.raw_row(y))).toreadonly()
+
+    def pixel(self, x: int, y: int):
+        """Give the samples of a pixel
+
+        :param x: abscissa of the pixel
+        :type x: int
+        :param y: ordinate of the pixel
+        :type y: int
+        :return: the `channels` samples of the pixel
+        :rtype: tuple[int]
+        """
+        start = x * self.channels
+        return tuple(self.row(y)[start : start + self.channels])
+
+
+class WidePicture(Picture):
+    """Picture of a file whose maximum color value is above 255.
+
+    The samples of the file are kept as they are, two bytes per sample, so
+    that they can be written again without loss (see `wide_row`). `row` and
+    `buffer` give them rebalanced between 0 and 255, like other pictures.
+    """
+
+    def __init__(self, width: int, height: int, channels: int, data, maximum: int):
+        """Initialisation
+
+        :param width: width of the image, in pixels
+        :type width: int
+        :param height: height of the image, in pixels
+        :type height: int
+        :param channels: number of samples per pixel (1 or 3)
+        :type channels: int
+        :param data: the samples (see `tables.wide_samples`)
+        :type data: array.array
+        :param maximum: the maximum color value of the samples (256 to 65535)
+        :type maximum: int
+        :raises ValueError: the buffer size does not match the image size
+        """
+        super().__init__(width, height, channels, data)
+        self.maximum = maximum
+
+    def narrow(self, samples):
+        """Rebalance samples between 0 and 255
+
+        :param samples: the 16-bit samples
+        :type samples: array.array
+        :return: the rebalanced samples
+        :rtype: bytearray
+        """
+        if vectorized.AVAILABLE:
+            return bytearray(vectorized.scale(samples, self.maximum))
+        return tables.scale(samples, self.maximum)
+
+    def buffer(self):
+        """Give a read-only view over the whole packed raster, rebalanced
+        between 0 and 255 at each call
+
+        :return: the packed samples
+        :rtype: memoryview
+        """
+        return memoryview(self.narrow(self.data)).toreadonly()
+
+    def row(self, y: int):
+        """Give a read-only view over the samples of a row, rebalanced between
+        0 and 255
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row
+        :rtype: memoryview
+        """
+        start = y * self.row_size
+        samples = self.narrow(self.data[start : start + self.row_size])
+        return memoryview(samples).toreadonly()
+
+    def wide_row(self, y: int):
+        """Give a read-only view over the samples of a row, as in the file
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row, up to `maximum`
+        :rtype: memoryview
+        """
+        start = y * self.row_size
+        return memoryview(self.data)[start : start + self.row_size].toreadonly()
+
+    def transform(self, transformation):
+        """Apply a transformation moving pixels around to the samples, the
+        low and high bytes of the samples being moved as two pictures
+
+        :param transformation: function transforming a picture
+        :type transformation: callable
+        :return: the transformed picture, with the same maximum color value
+        :rtype: WidePicture
+        """
+        raw = memoryview(self.data).cast("B")
+        low, high = (
+            transformation(
+                Picture(self.width, self.height, self.channels, bytearray(raw[half::2]))
+            )
+            for half in (0, 1)
+        )
+        raw = bytearray(2 * len(low.data))
+        raw[0::2] = low.data
+        raw[1::2] = high.data
+        samples = array("H")
+        samples.frombytes(raw)
+        return WidePicture(low.width, low.height, self.channels, samples, self.maximum)
+
+    def crop(self, x: int, y: int, width: int, height: int):
+        """Copy a rectangular part of the picture (see `Picture.crop`)
+
+        :return: the transformed picture, with the same maximum color value
+        :rtype: WidePicture
+        """
+        return self.transform(lambda picture: picture.crop(x, y, width, height))
+
+    def rotate(self, angle: int):
+        """Rotate the picture to the left (see `Picture.rotate`)
+
+        :return: the transformed picture, with the same maximum color value
+            (the picture itself for 0)
+        :rtype: WidePicture
+        """
+        if angle == 0:
+            return self
+        return self.transform(lambda picture: picture.rotate(angle))
+
+    def resize(self, width: int, height: int):
+        """Resize the picture, each pixel taking the color of the nearest
+        pixel of the picture (see `Picture.resize`)
+
+        :return: the transformed picture, with the same maximum color value
+        :rtype: WidePicture
+        """
+        return self.transform(lambda picture: picture.resize(width, height))
+
+    def halve(self):
+        """Reduce the picture to half its size, each sample being the average
+        of the samples of a block of 2x2 pixels (see `Picture.halve`)
+
+        :return: the reduced picture, with the same maximum color value
+        :rtype: WidePicture
+        """
+        channels = self.channels
+        width, height = -(-self.width // 2), -(-self.height // 2)
+        if vectorized.AVAILABLE:
+            samples = vectorized.halve(self.data, channels, self.width, self.height)
+            return WidePicture(width, height, channels, samples, self.maximum)
+        samples = array("H")
+        step = 2 * channels
+        for y in range(height):
+            top = self.wide_row(2 * y).tolist()
+            bottom = self.wide_row(min(2 * y + 1, self.height - 1)).tolist()
+            if self.width % 2:
+                top += top[-channels:]
+                bottom += bottom[-channels:]
+            row = [0] * (width * channels)
+            for channel in range(channels):
+                row[channel::channels] = map(
+                    lambda a, b, c, d: (a + b + c + d + 2) >> 2,
+                    top[channel::step],
+                    top[channel + channels :: step],
+                    bottom[channel::step],
+                    bottom[channel + channels :: step],
+                )
+            samples.extend(row)
+        return WidePicture(width, height, channels, samples, self.maximum)
+
+    def pixel(self, x: int, y: int):
+        """Give the samples of a pixel, rebalanced between 0 and 255
+
+        :param x: abscissa of the pixel
+        :type x: int
+        :param y: ordinate of the pixel
+        :type y: int
+        :return: the `channels` samples of the pixel
+        :rtype: tuple[int]
+        """
+        start = x * self.channels
+        return tuple(self.row(y)[start : start + self.channels])
+
+
+class IndexedPicture(Picture):
+    """Picture with few colors, stored as a palette and, for each pixel, the
+    index of its color in the palette (one byte per pixel).
+
+    Rows are turned back into samples with one `bytes.translate` per
+    channel, and most transformations work on the indexes directly.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        channels: int,
+        indexes: bytearray,
+        palette: list,
+    ):
+        """Initialisation
+
+        :param width: width of the image, in pixels
+        :type width: int
+        :param height: height of the image, in pixels
+        :type height: int
+        :param channels: number of samples per pixel (1 or 3)
+        :type channels: int
+        :param indexes: the index of the color of each pixel, row by row
+        :type indexes: bytearray
+        :param palette: the colors, `channels` samples each (at most 256)
+        :type palette: list[tuple[int]]
+        :raises ValueError: the indexes do not match the image size, or the
+            palette is too big
+        """
+        if channels not in {1, 3}:
+            raise ValueError("A picture has either 1 or 3 channels")
+        if len(indexes) != width * height:
+            raise ValueError("The buffer size does not match the picture size")
+        if len(palette) > 256:
+            raise ValueError("A palette has at most 256 colors")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.row_size = width * channels
+        self.indexes = indexes
+        self.palette = palette
+        # one translation table per channel, from indexes to samples
+        self.tables = [
+            bytes(color[channel] for color in palette).ljust(256, b"\0")
+            for channel in range(channels)
+        ]
+
+    def samples(self, indexes):
+        """Turn indexes into the samples of their colors
+
+        :param indexes: indexes in the palette
+        :type indexes: bytes
+        :return: the samples, `channels` per index
+        :rtype: bytearray
+        """
+        samples = bytearray(len(indexes) * self.channels)
+        for channel, table in enumerate(self.tables):
+            samples[channel :: self.channels] = indexes.translate(table)
+        return samples
+
+    def transform(self, transformation):
+        """Apply a transformation moving pixels around to the indexes,
+        keeping the palette
+
+        :param transformation: function transforming a one channel picture
+        :type transformation: callable
+        :return: the transformed picture
+        :rtype: IndexedPicture
+        """
+        indexes = Picture(self.width, self.height, 1, self.indexes)
+        picture = transformation(indexes)
+        return IndexedPicture(
+            picture.width, picture.height, self.channels, picture.data, self.palette
+        )
+
+    def buffer(self):
+        """Give a read-only view over the whole packed raster
+        The samples are built from the indexes at each call.
+
+        :return: the packed samples
+        :rtype: memoryview
+        """
+        return memoryview(self.samples(self.indexes)).toreadonly()
+
+    def crop(self, x: int, y: int, width: int, height: int):
+        """Copy a rectangular part of the picture (see `Picture.crop`)
+
+        :return: the transformed picture, with the same palette
+        :rtype: IndexedPicture
+        """
+        return self.transform(lambda picture: picture.crop(x, y, width, height))
+
+    def rotate(self, angle: int):
+        """Rotate the picture to the left (see `Picture.rotate`)
+
+        :return: the transformed picture, with the same palette
+        :rtype: IndexedPicture
+        """
+        return self.transform(lambda picture: picture.rotate(angle))
+
+    def resize(self, width: int, height: int):
+        """Resize the picture, each pixel taking the color of the nearest
+        pixel of the picture (see `Picture.resize`)
+
+        :return: the transformed picture, with the same palette
+        :rtype: IndexedPicture
+        """
+        return self.transform(lambda picture: picture.resize(width, height))
+
+    def index_row(self, y: int):
+        """Give a read-only view over the indexes of a row
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width` indexes of the row
+        :rtype: memoryview
+        """
+        start = y * self.width
+        return memoryview(self.indexes)[start : start + self.width].toreadonly()
+
+    def row(self, y: int):
+        """Give a read-only view over the samples of a row
+
+        :param y: the index of the row
+        :type y: int
+        :return: the `width * channels` samples of the row
+        :rtype: memoryview
+        """
+        start = y * self.width
+        samples = self.samples(self.indexes[start : start + self.width])
+        return memoryview(samples).toreadonly()
+
+    def pixel(self, x: int, y: int):
+        """Give the samples of a pixel
+
+        :param x: abscissa of the pixel
+        :type x: int
+        :param y: ordinate of the pixel
+        :type y: int
+        :return: the `channels` samples of the pixel
+        :rtype: tuple[int]
+        """
+        return self.palette[self.indexes[y * self.width + x]]
+
+
+def index_colors(picture: Picture, limit: int = 256):
+    """Store a RGB picture as a palette and indexes, if it has few colors
+
+    :param picture: the picture
+    :type picture: Picture
+    :param limit: maximum number of colors of the palette (at most 256),
+        defaults to 256
+    :type limit: int, optional
+    :return: the picture with a palette, None if the picture is not RGB or
+        has more than `limit` colors
+    :rtype: IndexedPicture | None
+    """
+    if picture.channels != 3:
+        return None
+    if vectorized.AVAILABLE:
+        found = vectorized.palette(picture.buffer(), limit)
+        if found is None:
+            return None
+        palette, indexes = found
+    else:
+        colors = set()
+        for y in range(picture.height):
+            row = picture.row(y)
+            colors.update(zip(row[0::3], row[1::3], row[2::3]))
+            if len(colors) > limit:
+                return None
+        palette = sorted(colors)
+        index = {color: position for position, color in enumerate(palette)}
+        data = picture.buffer()
+        pixels = zip(data[0::3], data[1::3], data[2::3])
+        indexes = bytearray(map(index.__getitem__, pixels))
+    return IndexedPicture(picture.width, picture.height, 3, indexes, palette)
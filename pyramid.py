@@ -0,0 +1,70 @@
+from picture import Picture
+
+
+class Pyramid:
+    """Reduced versions of a picture, used to display it zoomed out.
+
+    Level 0 is the picture itself, and each level is half the size of the
+    previous one (see `Picture.halve`). Levels are built when they are first
+    needed, from the smallest level already built, and can be kept in a
+    `RasterCache` so that they are not built again for the same file.
+    """
+
+    def __init__(self, picture: Picture, cache=None, filename: str = None):
+        """Initialisation
+
+        :param picture: the full size picture
+        :type picture: Picture
+        :param cache: cache where the levels are kept, defaults to None
+        :type cache: RasterCache, optional
+        :param filename: Path of the file of the picture, required to use the
+            cache, defaults to None
+        :type filename: str, optional
+        """
+        self.levels = [picture]
+        self.cache = cache if filename is not None else None
+        self.filename = filename
+
+    def __len__(self):
+        """Number of levels, down to a picture of 1x1 pixel"""
+        picture = self.levels[0]
+        return (max(picture.width, picture.height, 1) - 1).bit_length() + 1
+
+    def level(self, level: int):
+        """Give the picture of a level, building it if needed
+
+        :param level: the level (its size is the size of the picture divided
+            by 2 ** level, rounded up)
+        :type level: int
+        :raises ValueError: the level does not exist
+        :return: the reduced picture
+        :rtype: Picture
+        """
+        if not 0 <= level < len(self):
+            raise ValueError("The pyramid has no such level")
+        while len(self.levels) <= level:
+            index = len(self.levels)
+            picture = None
+            if self.cache is not None:
+                picture = self.cache.load_level(self.filename, index)
+            if picture is None:
+                picture = self.levels[-1].halve()
+                if self.cache is not None:
+                    self.cache.store_level(self.filename, index, picture)
+            self.levels.append(picture)
+        return self.levels[level]
+
+    def update(self, first: int, last: int):
+        """Build again the rows of the levels built so far which show rows
+        of the picture that were modified, and only them
+
+        :param first: the first modified row of the picture
+        :type first: int
+        :param last: the row after the last modified row of the picture
+        :type last: int
+        """
+        for index in range(1, len(self.levels)):
+            source = self.levels[index - 1]
+            first, last = first // 2, -(-last // 2)
+            band = source.crop(0, 2 * first, source.width, 2 * (last - first))
+            self.levels[index].paste(band.halve(), 0, first)
@@ -0,0 +1,105 @@
+"""Transformations applied to a picture to display it, usable without a
+window: `Bitmap` draws what `render` gives, and `export` writes it to a file.
+"""
+
+from picture import Picture
+from pyramid import Pyramid
+from writer import Writer
+
+
+def level(pyramid: Pyramid, zoom: float):
+    """Give the level of a pyramid used to display a picture at a zoom: the
+    smallest level which is not smaller than the displayed picture
+
+    :param pyramid: the pyramid of the picture
+    :type pyramid: Pyramid
+    :param zoom: the zoom
+    :type zoom: float
+    :return: the level, 0 (the picture itself) when zoom is 1 or more
+    :rtype: int
+    """
+    index = 0
+    while index < len(pyramid) - 1 and zoom * 2 ** (index + 1) <= 1:
+        index += 1
+    return index
+
+
+def scaled_size(picture: Picture, factor: float):
+    """Give the size of a picture resized by a factor
+
+    :param picture: the picture
+    :type picture: Picture
+    :param factor: the resizing factor
+    :type factor: float
+    :return: the width and height of the resized picture (at least 1)
+    :rtype: tuple[int, int]
+    """
+    return (
+        max(1, round(picture.width * factor)),
+        max(1, round(picture.height * factor)),
+    )
+
+
+def render(picture: Picture, rotate: int = 0, zoom: float = 1, pyramid=None):
+    """Rotate and zoom a picture the way `Bitmap` displays it
+
+    :param picture: the picture
+    :type picture: Picture
+    :param rotate: the rotation angle, to the left (0, 90, 180 or 270),
+        defaults to 0
+    :type rotate: int, optional
+    :param zoom: the zoom (1 pixel = `zoom` pixels), defaults to 1
+    :type zoom: float, optional
+    :param pyramid: reduced versions of the picture, used when zoomed out,
+        defaults to a pyramid built from the picture
+    :type pyramid: Pyramid, optional
+    :raises ValueError: the zoom is not positive
+    :return: the rotated and zoomed picture
+    :rtype: Picture
+    """
+    if zoom <= 0:
+        raise ValueError("The zoom must be positive")
+    if pyramid is None:
+        pyramid = Pyramid(picture)
+    index = level(pyramid, zoom)
+    shown = pyramid.level(index).rotate(rotate)
+    width, height = scaled_size(shown, zoom * 2**index)
+    if (width, height) == (shown.width, shown.height):
+        return shown
+    return shown.resize(width, height)
+
+
+def export(
+    infos: dict,
+    output_version: str,
+    output_name: str,
+    rotate: int = 0,
+    zoom: float = 1,
+):
+    """Write a picture, rotated and zoomed like `Bitmap` displays it, to a
+    file. No window is needed.
+
+    :param infos: dictionnary representing the image propreties
+    :type infos: dict
+    :param output_version: The version of PPM to write
+    :type output_version: str
+    :param output_name: name of the resulting file, without extension
+    :type output_name: str
+    :param rotate: the rotation angle, to the left (0, 90, 180 or 270),
+        defaults to 0
+    :type rotate: int, optional
+    :param zoom: the zoom (1 pixel = `zoom` pixels), defaults to 1
+    :type zoom: float, optional
+    :return: the name of the written file
+    :rtype: str
+    """
+    picture = render(infos["picture"], rotate, zoom)
+    rendered = {
+        "file version": infos["file version"],
+        "size": (picture.width, picture.height),
+        "maximum color value": picture.maximum,
+        "picture": picture,
+    }
+    writer = Writer(rendered, output_version, output_name)
+    writer.write()
+    return writer.file_name
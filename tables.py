@@ -0,0 +1,203 @@
+"""Lookup tables built once and shared by every file, so that samples are
+converted with `bytes.translate` or indexing instead of per-sample math.
+"""
+
+import sys
+from array import array
+from functools import cache
+
+
+@cache
+def scale_table(maximum: int):
+    """Build the table rebalancing samples between 0 and 255: entry n is
+    `int((n / maximum) * 255)`, as computed by `Parser.balance`.
+    Tables of maximum color values below 255 are padded to 256 entries so
+    that they can be given to `bytes.translate`.
+
+    :param maximum: the maximum color value of the samples (1 to 65535)
+    :type maximum: int
+    :return: the table
+    :rtype: bytes
+    """
+    table = bytes(int((n / maximum) * 255) for n in range(maximum + 1))
+    return table.ljust(256, b"\0")
+
+
+def scale(samples, maximum: int):
+    """Rebalance samples between 0 and 255 with the table of their maximum
+    color value
+
+    :param samples: the samples, either bytes or any iterable of integers
+    :type samples: bytes or Iterable[int]
+    :param maximum: the maximum color value of the samples
+    :type maximum: int
+    :raises ValueError: a sample is greater than the maximum color value
+    :return: the rebalanced samples
+    :rtype: bytearray
+    """
+    table = scale_table(maximum)
+    if maximum < 256:
+        samples = bytearray(samples)
+        if samples and max(samples) > maximum:
+            raise ValueError("A sample is out of the maximum color value")
+        return samples.translate(table)
+    try:
+        return bytearray(map(table.__getitem__, samples))
+    except IndexError:
+        raise ValueError("A sample is out of the maximum color value") from None
+
+
+@cache
+def bits_table():
+    """Build the table unpacking a byte of a P4 raster: entry n is the 8
+    samples of the bits of n, most significant first (1 is black and gives
+    0, 0 is white and gives 255).
+
+    :return: the table
+    :rtype: tuple[bytes]
+    """
+    return tuple(
+        bytes(0 if n >> (7 - bit) & 1 else 255 for bit in range(8))
+        for n in range(256)
+    )
+
+
+@cache
+def text_bits_table():
+    """Build the table translating the digits of a P1 raster to samples:
+    "0" is white and gives 255, any other character gives 0.
+
+    :return: the table
+    :rtype: bytes
+    """
+    return bytes(255 if n == ord("0") else 0 for n in range(256))
+
+
+def unpack_bits(raw, width: int, height: int):
+    """Unpack the rows of a P4 raster, dropping the padding bits of each row
+
+    :param raw: the raster, `(width + 7) // 8` bytes per row
+    :type raw: bytes
+    :param width: width of the image
+    :type width: int
+    :param height: number of rows of the raster
+    :type height: int
+    :return: the samples (0 or 255), row by row
+    :rtype: bytearray
+    """
+    samples = bytearray().join(map(bits_table().__getitem__, raw))
+    padded_width = (width + 7) // 8 * 8
+    if padded_width == width:
+        return samples
+    return bytearray().join(
+        samples[start : start + width]
+        for start in range(0, padded_width * height, padded_width)
+    )
+
+
+@cache
+def gray_table(channels: int):
+    """Build the table giving the gray level of a pixel from the sum of its
+    samples: entry n is `n // channels`.
+
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :return: the table, of `255 * channels + 1` entries
+    :rtype: bytes
+    """
+    return bytes(n // channels for n in range(255 * channels + 1))
+
+
+@cache
+def threshold_table(channels: int):
+    """Build the table giving the bit of a pixel in a P1 or P4 raster from
+    the sum of its samples: 1 (black) when the average of the samples is
+    below 127, 0 (white) otherwise.
+
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :return: the table, of `255 * channels + 1` entries
+    :rtype: bytes
+    """
+    return bytes(int(n < 127 * channels) for n in range(255 * channels + 1))
+
+
+@cache
+def sample_texts():
+    """Build the table writing samples in ascii rasters: entry n (0 to 255)
+    is `"n "`.
+
+    :return: the table
+    :rtype: tuple[str]
+    """
+    return tuple(f"{n} " for n in range(256))
+
+
+@cache
+def digits_table():
+    """Build the table translating bits (0 or 1) to the digits "0" and "1",
+    used to pack bits
+
+    :return: the table
+    :rtype: bytes
+    """
+    return bytes(ord("1") if n else ord("0") for n in range(256))
+
+
+def pack_bits(bits):
+    """Pack a row of a P4 raster: 8 pixels per byte, most significant bit
+    first, the last byte being padded with 0
+
+    :param bits: one byte per pixel, 1 for black and 0 for white
+    :type bits: bytes
+    :return: the `(len(bits) + 7) // 8` bytes of the row
+    :rtype: bytes
+    """
+    size = (len(bits) + 7) // 8
+    if size == 0:
+        return b""
+    digits = bytes(bits).translate(digits_table()).ljust(size * 8, b"0")
+    return int(digits, 2).to_bytes(size, "big")
+
+
+def wide_samples(samples, maximum: int):
+    """Store the samples of a file whose maximum color value is above 255
+    compactly, two bytes per sample
+
+    :param samples: the samples, either the big-endian 16-bit samples of a
+        binary raster or any iterable of integers
+    :type samples: bytes or Iterable[int]
+    :param maximum: the maximum color value of the samples
+    :type maximum: int
+    :raises ValueError: a sample is greater than the maximum color value
+    :return: the samples, in the byte order of the machine
+    :rtype: array.array
+    """
+    if isinstance(samples, (bytes, bytearray, memoryview)):
+        wide = array("H")
+        wide.frombytes(samples)
+        if sys.byteorder == "little":
+            wide.byteswap()
+    else:
+        try:
+            wide = array("H", samples)
+        except OverflowError:
+            raise ValueError("A sample is out of the maximum color value") from None
+    if wide and max(wide) > maximum:
+        raise ValueError("A sample is out of the maximum color value")
+    return wide
+
+
+def wide_bytes(samples):
+    """Write 16-bit samples as in a binary raster, most significant byte
+    first
+
+    :param samples: the samples
+    :type samples: array.array or Iterable[int]
+    :return: two bytes per sample
+    :rtype: bytes
+    """
+    samples = array("H", samples)
+    if sys.byteorder == "little":
+        samples.byteswap()
+    return samples.tobytes()
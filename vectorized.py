@@ -0,0 +1,234 @@
+"""Optional NumPy engine used by `Parser` and `Writer` to decode and convert
+whole rasters without Python-level loops. When NumPy is not installed,
+`AVAILABLE` is False and the pure Python code is used instead.
+"""
+
+import warnings
+from array import array
+from functools import cache
+
+import tables
+
+try:
+    import numpy as np
+
+    AVAILABLE = True
+except ImportError:
+    np = None
+    AVAILABLE = False
+
+
+@cache
+def ascii_formats():
+    """Build the table used to write samples as text: entry n (0 to 255) is
+    `"n "`, entry 256 is the end of a row.
+
+    :return: the left-aligned texts and their lengths
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    texts = [f"{n} ".encode() for n in range(256)] + [b"\n"]
+    table = np.zeros((len(texts), 4), dtype=np.uint8)
+    for index, text in enumerate(texts):
+        table[index, : len(text)] = list(text)
+    lengths = np.array([len(text) for text in texts], dtype=np.uint8)
+    return table, lengths
+
+
+def decode_ascii(text: bytes):
+    """Read every whitespace separated integer of an ascii raster
+
+    :param text: the raster
+    :type text: bytes
+    :raises ValueError: the raster contains something else than integers
+    :return: the integers
+    :rtype: numpy.ndarray
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.int64, sep=" ")
+        except DeprecationWarning:
+            raise ValueError("The raster contains invalid values") from None
+
+
+def unpack_bits(raw: bytes, width: int, height: int):
+    """Unpack a P4 raster, one bit per pixel (1 being black) and rows padded
+    to whole bytes
+
+    :param raw: the raster
+    :type raw: bytes
+    :param width: width of the image
+    :type width: int
+    :param height: height of the image
+    :type height: int
+    :return: the samples (0 or 255), row by row
+    :rtype: numpy.ndarray
+    """
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(height, -1)
+    bits = np.unpackbits(rows, axis=1)[:, :width]
+    return np.ascontiguousarray(bits ^ 1) * np.uint8(255)
+
+
+def scale(samples, maximum: int):
+    """Rebalance samples to get their values between 0 and 255, with the
+    same tables as the pure Python code
+
+    :param samples: the samples
+    :type samples: numpy.ndarray, bytes or array.array
+    :param maximum: the maximum color value of the samples
+    :type maximum: int
+    :raises ValueError: a sample is greater than the maximum color value
+    :return: the rebalanced samples
+    :rtype: numpy.ndarray
+    """
+    if isinstance(samples, array):
+        samples = np.frombuffer(samples, dtype=np.uint16)
+    elif isinstance(samples, (bytes, bytearray, memoryview)):
+        samples = np.frombuffer(samples, dtype=np.uint8)
+    if samples.size and (samples.min() < 0 or samples.max() > maximum):
+        raise ValueError("A sample is out of the maximum color value")
+    table = np.frombuffer(tables.scale_table(maximum), dtype=np.uint8)
+    return table[samples]
+
+
+def encode(buffer, channels: int, width: int, height: int, version: str):
+    """Convert a packed raster to the raster of any version
+
+    :param buffer: the packed samples, `channels` per pixel
+    :type buffer: memoryview
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :param width: width of the image
+    :type width: int
+    :param height: height of the image
+    :type height: int
+    :param version: the version to convert to (P1 to P6)
+    :type version: str
+    :return: the raster, as written in the file
+    :rtype: bytes
+    """
+    pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, channels)
+    if version in {"P1", "P2", "P4", "P5"}:
+        # the same lookup tables as the pure Python code, indexed by the sum
+        # of the samples of each pixel
+        if version in {"P1", "P4"}:
+            table = tables.threshold_table(channels)
+        else:
+            table = tables.gray_table(channels)
+        totals = pixels.sum(axis=2, dtype=np.uint16)
+        samples = np.frombuffer(table, dtype=np.uint8)[totals]
+    else:
+        samples = np.repeat(pixels, 3 // channels, axis=2)
+    samples = samples.reshape(height, -1)
+    if version == "P4":
+        return np.packbits(samples, axis=1).tobytes()
+    if version in {"P5", "P6"}:
+        return samples.tobytes()
+
+    # text rasters: every sample followed by a space, every row by a newline
+    table, lengths = ascii_formats()
+    end_of_row = np.full((height, 1), 256, dtype=np.uint16)
+    indexes = np.hstack((samples.astype(np.uint16), end_of_row)).ravel()
+    texts = table[indexes]
+    mask = np.arange(4) < lengths[indexes][:, None]
+    return texts[mask].tobytes()
+
+
+def rotate(buffer, channels: int, width: int, height: int, angle: int):
+    """Rotate a packed raster to the left
+
+    :param buffer: the packed samples, `channels` per pixel
+    :type buffer: memoryview
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :param width: width of the image
+    :type width: int
+    :param height: height of the image
+    :type height: int
+    :param angle: the rotation angle (90, 180 or 270)
+    :type angle: int
+    :return: the rotated samples
+    :rtype: bytearray
+    """
+    pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, channels)
+    return bytearray(np.rot90(pixels, angle // 90).tobytes())
+
+
+def halve(buffer, channels: int, width: int, height: int):
+    """Reduce a packed raster to half its size, each pixel being the average
+    of a block of 2x2 pixels (the last row and column are repeated when the
+    size is odd)
+
+    :param buffer: the packed samples, `channels` per pixel, 16-bit samples
+        being given as an array
+    :type buffer: memoryview or array.array
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :param width: width of the image
+    :type width: int
+    :param height: height of the image
+    :type height: int
+    :return: the reduced samples, of the same size as the given ones
+    :rtype: bytearray or array.array
+    """
+    wide = isinstance(buffer, array)
+    dtype, total_dtype = (np.uint16, np.uint32) if wide else (np.uint8, np.uint16)
+    pixels = np.frombuffer(buffer, dtype=dtype).reshape(height, width, channels)
+    pixels = np.pad(pixels, ((0, height % 2), (0, width % 2), (0, 0)), mode="edge")
+    blocks = pixels.reshape(-(-height // 2), 2, -(-width // 2), 2, channels)
+    total = blocks.sum(axis=(1, 3), dtype=total_dtype)
+    reduced = ((total + 2) >> 2).astype(dtype).tobytes()
+    if wide:
+        samples = array("H")
+        samples.frombytes(reduced)
+        return samples
+    return bytearray(reduced)
+
+
+def resize(buffer, channels: int, width: int, height: int, size: tuple):
+    """Resize a packed raster, each pixel taking the color of the nearest
+    pixel of the raster
+
+    :param buffer: the packed samples, `channels` per pixel
+    :type buffer: memoryview
+    :param channels: number of samples per pixel (1 or 3)
+    :type channels: int
+    :param width: width of the image
+    :type width: int
+    :param height: height of the image
+    :type height: int
+    :param size: the width and height of the resized image
+    :type size: tuple[int, int]
+    :return: the resized samples
+    :rtype: bytearray
+    """
+    pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, channels)
+    rows = np.arange(size[1]) * height // size[1]
+    columns = np.arange(size[0]) * width // size[0]
+    return bytearray(pixels[rows][:, columns].tobytes())
+
+
+def palette(buffer, limit: int, chunk: int = 1 << 16):
+    """Find the colors of a RGB raster, if there are few of them
+
+    :param buffer: the packed samples, 3 per pixel
+    :type buffer: memoryview
+    :param limit: maximum number of colors (at most 256)
+    :type limit: int
+    :param chunk: number of pixels looked at between two checks of the
+        number of colors, defaults to 65536
+    :type chunk: int, optional
+    :return: the sorted colors and the index of the color of each pixel,
+        None if there are more than `limit` colors
+    :rtype: tuple[list[tuple[int, int, int]], bytearray] | None
+    """
+    pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, 3).astype(np.uint32)
+    codes = pixels[:, 0] << 16 | pixels[:, 1] << 8 | pixels[:, 2]
+    colors = np.empty(0, dtype=np.uint32)
+    for start in range(0, len(codes), chunk):
+        colors = np.union1d(colors, codes[start : start + chunk])
+        if len(colors) > limit:
+            return None
+    indexes = np.searchsorted(colors, codes).astype(np.uint8)
+    colors = [(code >> 16, code >> 8 & 255, code & 255) for code in colors.tolist()]
+    return colors, bytearray(indexes.tobytes())
@@ -1,26 +1,60 @@
 import os
+from array import array
+
+import tables
+import vectorized
+from picture import IndexedPicture
+
+# extension of the files of each version
+EXTENSIONS = {
+    "P1": "pbm",
+    "P2": "pgm",
+    "P3": "ppm",
+    "P4": "pbm",
+    "P5": "pgm",
+    "P6": "ppm",
+}
+# characters not allowed in the name of a converted file
+ILLEGAL_CHARACTERS = '#%&}{\\<>*?/ $!`":@+|=\''
 
 
 class Writer:
     """Object that create a PPM file"""
 
-    def __init__(self, infos: dict, output_version: str, output_name: str):
+    def __init__(
+        self, infos: dict, output_version: str, output_name: str, directory: str = "."
+    ):
         """Initialisation
 
-        :param infos: dictionnary representing the image propreties
+        :param infos: dictionnary representing the image propreties. If the
+            picture is not decoded (a Parser created with `stream`), its rows
+            are decoded, converted and written one at a time
         :type infos: dict
         :param output_version: The version of PPM to convert
         :type output_version: str
         :param output_name: name of the resulting file
         :type output_name: str
+        :param directory: the folder of the resulting file, defaults to the
+            current folder
+        :type directory: str, optional
         """
         self.infos = infos
         self.output_version = output_version
         self.picture = infos["picture"]
+        if self.picture is None:
+            self.channels = 3 if infos["file version"] in {"P3", "P6"} else 1
+            maximum = infos["maximum color value"]
+            self.maximum_color_value = maximum if maximum > 255 else 255
+        else:
+            self.channels = self.picture.channels
+            self.maximum_color_value = self.picture.maximum
+        # samples above 255 are written as they are, except in bitmaps
+        bitmap = output_version in {"P1", "P4"}
+        self.wide = self.maximum_color_value > 255 and not bitmap
         self.picture_version = infos["file version"]
         self.picture_size = infos["size"]
-        self.maximum_color_value = infos["maximum color value"]
         self.output_name = output_name
+        self.directory = directory
         self.file_name = self.is_name_valid()
 
     def is_name_valid(self):
@@ -31,31 +65,181 @@ class Writer:
         :return: the name of the file if valid
         :rtype: str
         """
-        extension = {
-            "P1": "pbm",
-            "P2": "pgm",
-            "P3": "ppm",
-            "P4": "pbm",
-            "P5": "pgm",
-            "P6": "ppm",
-        }
-        name = f"{self.output_name}.{extension[self.output_version]}"
+        name = f"{self.output_name}.{EXTENSIONS[self.output_version]}"
+        if self.directory != ".":
+            name = os.path.join(self.directory, name)
         if os.path.isfile(name):
             raise FileExistsError(
                 "An existing file has this name on the selected folder"
             )
-        illegal_car = '#%&}{\<>*?/ $!`":@+|='
         for car in self.output_name:
-            if car in illegal_car or car == "'":
+            if car in ILLEGAL_CHARACTERS:
                 raise ValueError("The file name contain illegal characters")
         return name
 
     def write(self):
-        """Main function"""
-        if self.output_version in {"P1", "P2", "P3"}:
-            self.write_raw()
+        """Main function
+        The file is removed if the picture cannot be decoded while it is
+        written.
+        """
+        try:
+            if self.output_version in {"P1", "P2", "P3"}:
+                self.write_raw()
+            else:
+                self.write_ascii()
+        except ValueError:
+            os.remove(self.file_name)
+            raise
+
+    def rows(self):
+        """Give the samples of each row of the picture. Rows of a picture
+        which is not decoded are decoded from the file as they are needed.
+
+        :return: the rows, from top to bottom
+        :rtype: Iterator[bytes | memoryview]
+        """
+        if self.picture is None:
+            return self.infos.iter_rows(self.wide)
+        row = self.picture.wide_row if self.wide else self.picture.row
+        return map(row, range(self.picture.height))
+
+    def encode(self):
+        """Convert the whole raster at once with the NumPy engine
+
+        :return: the raster of the output version
+        :rtype: bytes
+        """
+        return vectorized.encode(
+            self.picture.buffer(),
+            self.channels,
+            *self.picture_size,
+            self.output_version,
+        )
+
+    def convert(self, samples):
+        """Convert samples to the values of P1 and P4 rasters (1 for dark
+        pixels, 0 for the others) or of P2 and P5 rasters (gray levels), with
+        the lookup tables indexed by the sum of the samples of each pixel
+
+        :param samples: the samples, `channels` per pixel
+        :type samples: bytes | memoryview
+        :return: one value per pixel
+        :rtype: bytes
+        """
+        if self.output_version in {"P1", "P4"}:
+            table = tables.threshold_table(self.channels)
         else:
-            self.write_ascii()
+            table = tables.gray_table(self.channels)
+        if self.channels == 1:
+            return bytes(samples).translate(table)
+        totals = map(
+            lambda red, green, blue: red + green + blue,
+            samples[0::3],
+            samples[1::3],
+            samples[2::3],
+        )
+        return bytes(map(table.__getitem__, totals))
+
+    def format_values(self, values):
+        """Write a row of values given by `convert` as in the file
+
+        :param values: one value per pixel of the row
+        :type values: bytes
+        :return: the row (as text for P1 and P2, packed bits for P4)
+        :rtype: bytes | str
+        """
+        if self.output_version in {"P1", "P2"}:
+            return "".join(map(tables.sample_texts().__getitem__, values)) + "\n"
+        if self.output_version == "P4":
+            return tables.pack_bits(values)
+        return values
+
+    def encode_palette(self):
+        """Convert the raster of a picture with a palette: each color of the
+        palette is converted once, then the indexes are replaced by the
+        converted colors
+
+        :return: the raster of the output version (as text for P1 to P3)
+        :rtype: bytes | str
+        """
+        palette = self.picture.palette
+        indexes = self.picture.indexes
+        width = self.picture.width
+        rows = range(0, len(indexes), width)
+        if self.output_version == "P6":
+            return self.picture.buffer()
+        if self.output_version == "P3":
+            repeat = 3 // self.channels
+            texts = [
+                "".join(f"{sample} " for sample in color) * repeat for color in palette
+            ]
+            return "".join(
+                "".join(map(texts.__getitem__, indexes[start : start + width])) + "\n"
+                for start in rows
+            )
+        samples = bytes(sample for color in palette for sample in color)
+        values = indexes.translate(self.convert(samples).ljust(256, b"\0"))
+        join = "".join if self.output_version in {"P1", "P2"} else b"".join
+        return join(self.format_values(values[start : start + width]) for start in rows)
+
+    def encode_row(self, row):
+        """Convert a row of the picture to the output version, as a whole
+
+        :param row: the samples of the row
+        :type row: bytes | memoryview
+        :return: the row, as written in the file (as text for P1 to P3)
+        :rtype: bytes | str
+        """
+        if self.wide:
+            return self.encode_wide_row(row)
+        if vectorized.AVAILABLE:
+            width = len(row) // self.channels
+            encoded = vectorized.encode(
+                row, self.channels, width, 1, self.output_version
+            )
+            if self.output_version in {"P1", "P2", "P3"}:
+                return encoded.decode()
+            return encoded
+        if self.output_version == "P3":
+            texts = tables.sample_texts()
+            repeat = 3 // self.channels
+            return "".join(texts[sample] * repeat for sample in row) + "\n"
+        if self.output_version != "P6":
+            return self.format_values(self.convert(row))
+        if self.channels == 3:
+            return bytes(row)
+        samples = bytearray(3 * len(row))
+        for channel in range(3):
+            samples[channel::3] = row
+        return samples
+
+    def encode_wide_row(self, row):
+        """Convert a row of samples above 255 to the output version (P2, P3,
+        P5 or P6), keeping their values
+
+        :param row: the 16-bit samples of the row
+        :type row: array.array | memoryview
+        :return: the row, as written in the file (as text for P2 and P3)
+        :rtype: bytes | str
+        """
+        if self.output_version in {"P2", "P5"} and self.channels == 3:
+            row = array(
+                "H",
+                map(
+                    lambda red, green, blue: (red + green + blue) // 3,
+                    row[0::3],
+                    row[1::3],
+                    row[2::3],
+                ),
+            )
+        elif self.output_version in {"P3", "P6"} and self.channels == 1:
+            samples = array("H", bytes(6 * len(row)))
+            for channel in range(3):
+                samples[channel::3] = array("H", row)
+            row = samples
+        if self.output_version in {"P5", "P6"}:
+            return tables.wide_bytes(row)
+        return "".join(map("{} ".format, row)) + "\n"
 
     def write_raw(self):
         """Write a non binary file"""
@@ -64,23 +248,14 @@ class Writer:
             file.write(self.output_version + "\n")
             file.write(f"{width} {height}\n")
             if self.output_version != "P1":
-                file.write(f"{255}\n")
-
-            for y in range(height):
-                for x in range(width):
-                    cell = self.picture[y][x]
-                    if self.output_version == "P1":
-                        avg = sum(cell) / 3
-                        if avg < 127:
-                            file.write("1 ")
-                        else:
-                            file.write("0 ")
-                    elif self.output_version == "P2":
-                        avg = int(sum(cell) / 3)
-                        file.write(f"{avg} ")
-                    else:
-                        file.write(f"{cell[0]} {cell[1]} {cell[2]} ")
-                file.write("\n")
+                file.write(f"{self.maximum_color_value}\n")
+            if isinstance(self.picture, IndexedPicture):
+                file.write(self.encode_palette())
+                return
+            if vectorized.AVAILABLE and self.picture is not None and not self.wide:
+                file.write(self.encode().decode())
+                return
+            file.writelines(map(self.encode_row, self.rows()))
 
     def write_ascii(self):
         """Write a binary file"""
@@ -89,21 +264,11 @@ class Writer:
             file.write(f"{self.output_version}\n".encode())
             file.write(f"{width} {height}\n".encode())
             if self.output_version != "P4":
-                file.write(f"{255}\n".encode())
-
-            for y in range(height):
-                for x in range(width):
-                    cell = self.picture[y][x]
-                    if self.output_version == "P4":
-                        avg = sum(cell) / 3
-                        v = 0
-                        if avg < 127:
-                            v = 1
-                        file.write(v.to_bytes(1, "big"))
-                    elif self.output_version == "P5":
-                        avg = int(sum(cell) / 3)
-                        file.write(avg.to_bytes(1, "big"))
-                    else:
-                        file.write(cell[0].to_bytes(1, "big"))
-                        file.write(cell[1].to_bytes(1, "big"))
-                        file.write(cell[2].to_bytes(1, "big"))
+                file.write(f"{self.maximum_color_value}\n".encode())
+            if isinstance(self.picture, IndexedPicture):
+                file.write(self.encode_palette())
+                return
+            if vectorized.AVAILABLE and self.picture is not None and not self.wide:
+                file.write(self.encode())
+                return
+            file.writelines(map(self.encode_row, self.rows()))